@@ -0,0 +1,395 @@
+"""
+Local stand-ins for the external services used by the workflow.
+
+Each fake is a small threaded HTTP server that answers the handful of
+endpoints the application calls, with configurable latency and a fixed-window
+rate limiter so that quota exhaustion can be reproduced without real tokens:
+
+- FakeGitHub:   PR files, git trees and contents endpoints (GithubFileLoader).
+- FakeOpenAI:   OpenAI embeddings and (Azure) OpenAI chat completions.
+- FakeReportSink: accepts the report POSTs sent to REPORT_TARGET_URL.
+"""
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class ServiceProfile:
+    """
+    Latency and rate-limit behaviour of a fake service.
+
+    Attributes:
+        latency: Fixed delay added to every response, in seconds.
+        jitter: Upper bound of an additional uniformly distributed delay.
+        rate_limit: Requests allowed per window; 0 disables rate limiting.
+        rate_window: Length of the rate-limit window, in seconds.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate_limit: int = 0
+    rate_window: float = 3600.0
+
+
+class _FixedWindowLimiter:
+    """Counts requests in fixed windows and reports whether a request is allowed."""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._used = 0
+
+    def acquire(self) -> tuple[bool, int, float]:
+        """Returns (allowed, remaining, seconds until the window resets)."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window:
+                self._window_start = now
+                self._used = 0
+            reset_in = self.window - (now - self._window_start)
+            if self.limit and self._used >= self.limit:
+                return False, 0, reset_in
+            self._used += 1
+            remaining = self.limit - self._used if self.limit else -1
+            return True, remaining, reset_in
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.service.dispatch(self, "GET")
+
+    def do_POST(self):
+        self.server.service.dispatch(self, "POST")
+
+    def log_message(self, format, *args):
+        # Keep the harness output readable; request counts are tracked instead.
+        pass
+
+
+class FakeService:
+    """Base class: runs a ThreadingHTTPServer on a background thread."""
+
+    name = "fake"
+
+    def __init__(self, profile: Optional[ServiceProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        self.profile = profile or ServiceProfile()
+        self.limiter = _FixedWindowLimiter(self.profile.rate_limit, self.profile.rate_window)
+        self.requests = Counter()
+        self.rate_limited = 0
+        self.bytes_sent = 0
+        self._stats_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.service = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeService":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "requests": dict(self.requests),
+                "rate_limited": self.rate_limited,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    # --- request handling ---
+    def dispatch(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw_body = handler.rfile.read(length) if length else b""
+        url = urlparse(handler.path)
+
+        delay = self.profile.latency + (random.uniform(0, self.profile.jitter) if self.profile.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        allowed, remaining, reset_in = self.limiter.acquire()
+        if not allowed:
+            with self._stats_lock:
+                self.rate_limited += 1
+            status, body, headers = self.rate_limited_response(reset_in)
+        else:
+            try:
+                body_json = json.loads(raw_body) if raw_body else None
+            except json.JSONDecodeError:
+                body_json = None
+            route, status, body, headers = self.route(method, url.path, parse_qs(url.query), body_json)
+            with self._stats_lock:
+                self.requests[route] += 1
+            headers = {**headers, **self.rate_limit_headers(remaining, reset_in)}
+
+        payload = json.dumps(body).encode()
+        with self._stats_lock:
+            self.bytes_sent += len(payload)
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def route(self, method: str, path: str, query: dict, body) -> tuple[str, int, object, dict]:
+        """Returns (route name, status code, JSON body, extra headers)."""
+        raise NotImplementedError
+
+    def rate_limited_response(self, reset_in: float) -> tuple[int, object, dict]:
+        return 429, {"message": "rate limited"}, {"Retry-After": str(max(1, int(reset_in)))}
+
+    def rate_limit_headers(self, remaining: int, reset_in: float) -> dict:
+        return {}
+
+
+class FakeGitHub(FakeService):
+    """
+    Serves a synthetic Java code base for any repository name.
+
+    Every repository has `files_per_repo` classes with `methods_per_file`
+    methods each. A pull request modifies `files_per_pr` of those classes,
+    chosen deterministically from the PR number, and its patches apply
+    cleanly to the served file contents.
+    """
+
+    name = "fake-github"
+
+    _PR_FILES = re.compile(r"^/repos/([^/]+/[^/]+)/pulls/(\d+)/files$")
+    _TREE = re.compile(r"^/repos/([^/]+/[^/]+)/git/trees/([^/]+)$")
+    _CONTENTS = re.compile(r"^/repos/([^/]+/[^/]+)/contents/(.+)$")
+
+    def __init__(self, profile: Optional[ServiceProfile] = None, files_per_repo: int = 50,
+                 methods_per_file: int = 8, files_per_pr: int = 3, **kwargs):
+        super().__init__(profile, **kwargs)
+        self.files_per_repo = files_per_repo
+        self.methods_per_file = methods_per_file
+        self.files_per_pr = min(files_per_pr, files_per_repo)
+
+    # --- synthetic repository ---
+    @staticmethod
+    def _package(repo: str) -> str:
+        return "com.example." + (re.sub(r"[^a-z0-9]", "", repo.lower().split("/")[-1]) or "repo")
+
+    def file_path(self, index: int) -> str:
+        return f"src/main/java/com/example/Service{index}.java"
+
+    def file_content(self, repo: str, index: int) -> str:
+        lines = [f"package {self._package(repo)};", "", f"public class Service{index} {{"]
+        for m in range(self.methods_per_file):
+            callee = f"new Service{(index + 1) % self.files_per_repo}().method{m}(x)" if m else "x"
+            lines += [
+                f"    public int method{m}(int x) {{",
+                f"        return {callee} + {m};",
+                "    }",
+                "",
+            ]
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def pr_file_indexes(self, pr_number: int) -> list[int]:
+        return [(pr_number + k) % self.files_per_repo for k in range(self.files_per_pr)]
+
+    def pr_patch(self, repo: str, index: int, pr_number: int) -> str:
+        # Change the body of one method: header line 4 is method0's signature,
+        # and each method occupies four lines.
+        method = pr_number % self.methods_per_file
+        signature_line = 4 + method * 4
+        content = self.file_content(repo, index).split("\n")
+        signature, body, closing = content[signature_line - 1:signature_line + 2]
+        return (
+            f"@@ -{signature_line},3 +{signature_line},3 @@ public class Service{index} {{\n"
+            f" {signature}\n"
+            f"-{body}\n"
+            f"+{body[:-1]} + {pr_number};\n"
+            f" {closing}"
+        )
+
+    @staticmethod
+    def _sha(*parts) -> str:
+        return hashlib.sha1("/".join(str(p) for p in parts).encode()).hexdigest()
+
+    # --- routing ---
+    def route(self, method, path, query, body):
+        if method != "GET":
+            return "unknown", 404, {"message": "Not Found"}, {}
+
+        m = self._PR_FILES.match(path)
+        if m:
+            repo, pr_number = m.group(1), int(m.group(2))
+            files = [
+                {
+                    "sha": self._sha(repo, pr_number, i),
+                    "filename": self.file_path(i),
+                    "status": "modified",
+                    "additions": 1,
+                    "deletions": 1,
+                    "changes": 2,
+                    "patch": self.pr_patch(repo, i, pr_number),
+                }
+                for i in self.pr_file_indexes(pr_number)
+            ]
+            return "pulls.files", 200, files, {}
+
+        m = self._TREE.match(path)
+        if m:
+            repo, ref = m.groups()
+            tree = [{"path": "src", "mode": "040000", "type": "tree", "sha": self._sha(repo, "src")}]
+            tree += [
+                {
+                    "path": self.file_path(i),
+                    "mode": "100644",
+                    "type": "blob",
+                    "sha": self._sha(repo, ref, i),
+                    "size": len(self.file_content(repo, i)),
+                }
+                for i in range(self.files_per_repo)
+            ]
+            return "git.trees", 200, {"sha": self._sha(repo, ref), "tree": tree, "truncated": False}, {}
+
+        m = self._CONTENTS.match(path)
+        if m:
+            repo, file_path = m.groups()
+            m_index = re.fullmatch(r"src/main/java/com/example/Service(\d+)\.java", file_path)
+            if not m_index or int(m_index.group(1)) >= self.files_per_repo:
+                return "contents", 404, {"message": "Not Found"}, {}
+            content = self.file_content(repo, int(m_index.group(1)))
+            return "contents", 200, {
+                "type": "file",
+                "encoding": "base64",
+                "path": file_path,
+                "name": file_path.rsplit("/", 1)[-1],
+                "sha": self._sha(repo, file_path),
+                "size": len(content),
+                "content": base64.b64encode(content.encode()).decode(),
+            }, {}
+
+        return "unknown", 404, {"message": "Not Found"}, {}
+
+    def rate_limited_response(self, reset_in):
+        reset_at = int(time.time() + reset_in)
+        return 403, {"message": "API rate limit exceeded"}, {
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(reset_at),
+        }
+
+    def rate_limit_headers(self, remaining, reset_in):
+        if not self.profile.rate_limit:
+            return {}
+        return {
+            "X-RateLimit-Limit": str(self.profile.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(time.time() + reset_in)),
+        }
+
+
+class FakeOpenAI(FakeService):
+    """
+    Answers OpenAI embeddings and chat completion requests, including the
+    Azure deployment-scoped chat completions path used by generate_report.
+    Embeddings are deterministic pseudo-random unit vectors of the input.
+    """
+
+    name = "fake-openai"
+
+    _EMBEDDINGS = re.compile(r"^(?:/v1)?(?:/openai/deployments/[^/]+)?/embeddings$")
+    _CHAT = re.compile(r"^(?:/v1)?(?:/openai/deployments/[^/]+)?/chat/completions$")
+
+    def __init__(self, profile: Optional[ServiceProfile] = None, dimensions: int = 256,
+                 report: str = "<h1>PR 영향 분석 보고서</h1><p>load test</p>", **kwargs):
+        super().__init__(profile, **kwargs)
+        self.dimensions = dimensions
+        self.report = report
+
+    def _embed(self, item) -> list[float]:
+        seed = item if isinstance(item, str) else ",".join(map(str, item))
+        digest = hashlib.sha256(seed.encode()).digest()
+        values = []
+        counter = 0
+        while len(values) < self.dimensions:
+            block = hashlib.sha256(digest + struct.pack("<I", counter)).digest()
+            values.extend(b / 127.5 - 1.0 for b in block)
+            counter += 1
+        values = values[:self.dimensions]
+        norm = sum(v * v for v in values) ** 0.5 or 1.0
+        return [v / norm for v in values]
+
+    @staticmethod
+    def _token_count(item) -> int:
+        return len(item) if isinstance(item, list) else max(1, len(item) // 4)
+
+    def route(self, method, path, query, body):
+        if method != "POST" or not isinstance(body, dict):
+            return "unknown", 404, {"error": {"message": "Not Found"}}, {}
+
+        if self._EMBEDDINGS.match(path):
+            inputs = body.get("input", [])
+            # Inputs may be a single string, a list of strings or token arrays.
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            tokens = sum(self._token_count(item) for item in inputs)
+            return "embeddings", 200, {
+                "object": "list",
+                "model": body.get("model", "text-embedding-ada-002"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": self._embed(item)}
+                    for i, item in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }, {}
+
+        if self._CHAT.match(path):
+            prompt_tokens = sum(self._token_count(m.get("content") or "") for m in body.get("messages", []))
+            completion_tokens = self._token_count(self.report)
+            return "chat.completions", 200, {
+                "id": "chatcmpl-loadtest",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.report},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }, {}
+
+        return "unknown", 404, {"error": {"message": "Not Found"}}, {}
+
+
+class FakeReportSink(FakeService):
+    """Accepts report deliveries and remembers how many were received."""
+
+    name = "fake-report-sink"
+
+    def route(self, method, path, query, body):
+        if method != "POST":
+            return "unknown", 404, {"message": "Not Found"}, {}
+        return "reports", 202, {"status": "accepted"}, {}
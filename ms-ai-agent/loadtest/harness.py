@@ -0,0 +1,456 @@
+"""
+End-to-end load-test harness for the GitHub PR Impact Analyzer.
+
+Starts local stand-ins for GitHub, (Azure) OpenAI and the report target,
+points the application at them through environment variables, serves the
+FastAPI `app` from `main.py` with uvicorn and replays bursts of
+`pull_request` webhooks against it. At the end it reports throughput,
+end-to-end and per-node latency percentiles, queue depth and peak memory.
+Queue depth is sampled on both sides: requests the harness has in flight,
+and workflow runs the service has waiting for a workflow thread or running
+(see src/langgraph_workflow/runner.py).
+Analyses that finish with an error are reported separately and left out of
+throughput and latency.
+
+Run from the `ms-ai-agent` directory:
+
+    python -m loadtest.harness --bursts 3 --burst-size 10 --burst-interval 5
+    python -m loadtest.harness --replay deliveries.jsonl --json-out result.json
+
+Replay files contain one delivery per line, either a bare `pull_request`
+payload or an object {"event": ..., "payload": {...}, "offset": seconds}.
+
+OpenAIEmbeddings tokenizes input with tiktoken; for a fully offline run the
+encoding must already be present in TIKTOKEN_CACHE_DIR, or the local backend
+must be selected (EMBEDDING_BACKEND=local, see src/embedding/backends.py).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from loadtest.fakes import FakeGitHub, FakeOpenAI, FakeReportSink, ServiceProfile
+
+@dataclass
+class Delivery:
+    """A webhook delivery scheduled `offset` seconds after the run starts."""
+    offset: float
+    event: str
+    payload: dict
+
+
+@dataclass
+class RunResult:
+    latencies: list = field(default_factory=list)
+    failures: dict = field(default_factory=lambda: defaultdict(int))
+    statuses: dict = field(default_factory=lambda: defaultdict(int))
+    queue_samples: list = field(default_factory=list)
+    started: float = 0.0
+    finished: float = 0.0
+
+
+# --- Deliveries ---
+def synthetic_deliveries(bursts: int, burst_size: int, burst_interval: float, repos: int) -> list[Delivery]:
+    """Builds `bursts` bursts of `burst_size` PR webhooks spread over `repos` repositories."""
+    deliveries = []
+    pr_number = 1
+    for burst in range(bursts):
+        for i in range(burst_size):
+            repo = f"loadtest/repo-{i % repos}"
+            deliveries.append(Delivery(burst * burst_interval, "pull_request", pull_request_payload(repo, pr_number)))
+            pr_number += 1
+    return deliveries
+
+
+def pull_request_payload(repo_full_name: str, pr_number: int, action: str = "opened") -> dict:
+    return {
+        "action": action,
+        "number": pr_number,
+        "pull_request": {
+            "number": pr_number,
+            "html_url": f"https://github.com/{repo_full_name}/pull/{pr_number}",
+            "base": {"ref": "main", "sha": base_sha(repo_full_name)},
+            "head": {"ref": f"feature-{pr_number}", "sha": f"{pr_number:040x}"},
+        },
+        "repository": {
+            "id": zlib.crc32(repo_full_name.encode()),
+            "full_name": repo_full_name,
+            "default_branch": "main",
+        },
+    }
+
+
+def prewarm_deliveries(deliveries: list[Delivery]) -> list[Delivery]:
+    """One default-branch push for each base commit the PRs in `deliveries` use."""
+    commits = {}
+    for d in deliveries:
+        base_sha = ((d.payload.get("pull_request") or {}).get("base") or {}).get("sha")
+        if d.event == "pull_request" and base_sha:
+            repository = d.payload["repository"]
+            commits[(repository["full_name"], base_sha)] = repository.get("default_branch", "main")
+    return [Delivery(0.0, "push", push_payload(repo, sha, branch)) for (repo, sha), branch in commits.items()]
+
+
+def wait_for_indexes(deliveries: list[Delivery], timeout: float) -> bool:
+    """Waits until the pushed commits are indexed. Returns False on timeout."""
+    from src.repo_index.cache import get_index_cache
+
+    pending = {(d.payload["repository"]["full_name"], d.payload["after"]) for d in deliveries}
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        pending = {key for key in pending if not get_index_cache().contains(*key)}
+        time.sleep(0.1)
+    return not pending
+
+
+def push_payload(repo_full_name: str, sha: str, default_branch: str = "main") -> dict:
+    return {
+        "ref": f"refs/heads/{default_branch}",
+        "before": "0" * 40,
+        "after": sha,
+        "deleted": False,
+        "repository": {
+            "id": zlib.crc32(repo_full_name.encode()),
+            "full_name": repo_full_name,
+            "default_branch": default_branch,
+        },
+    }
+
+
+def base_sha(repo_full_name: str) -> str:
+    """Commit on the default branch that synthetic PRs of a repository are based on."""
+    return hashlib.sha1(f"{repo_full_name}@main".encode()).hexdigest()
+
+
+def load_deliveries(path: str) -> list[Delivery]:
+    """Reads recorded deliveries from a JSON lines file."""
+    deliveries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "payload" in record:
+                deliveries.append(Delivery(float(record.get("offset", 0.0)),
+                                           record.get("event", "pull_request"),
+                                           record["payload"]))
+            else:
+                deliveries.append(Delivery(0.0, "pull_request", record))
+    return sorted(deliveries, key=lambda d: d.offset)
+
+
+# --- Measurement helpers ---
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def peak_rss_bytes() -> int:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux.
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+@dataclass
+class NodeStats:
+    durations: list = field(default_factory=list)
+    totals: dict = field(default_factory=lambda: defaultdict(float))
+    errors: dict = field(default_factory=lambda: defaultdict(int))
+
+
+def collect_node_spans() -> dict[str, NodeStats]:
+    """Subscribes to the workflow's node spans and collects durations and counters per node."""
+    from src.telemetry.spans import add_span_listener
+
+    nodes: dict[str, NodeStats] = defaultdict(NodeStats)
+
+    def listener(span):
+        stats = nodes[span.node]
+        stats.durations.append(span.duration)
+        if span.error:
+            stats.errors[span.error] += 1
+        for key, value in span.attributes.items():
+            stats.totals[key] += value
+
+    add_span_listener(listener)
+    return nodes
+
+
+# --- Processes under test ---
+def start_fakes(args) -> dict:
+    github = FakeGitHub(
+        ServiceProfile(args.github_latency, args.github_jitter, args.github_rate_limit, args.github_rate_window),
+        files_per_repo=args.files_per_repo,
+        methods_per_file=args.methods_per_file,
+        files_per_pr=args.files_per_pr,
+    ).start()
+    openai = FakeOpenAI(
+        ServiceProfile(args.openai_latency, args.openai_jitter, args.openai_rate_limit, args.openai_rate_window),
+        dimensions=args.embedding_dimensions,
+    ).start()
+    sink = FakeReportSink().start()
+    return {"github": github, "openai": openai, "report_sink": sink}
+
+
+def configure_environment(fakes: dict) -> None:
+    """
+    Points the application at the fakes. Values in .env are not applied over
+    these. State the service keeps on disk goes to a fresh temporary
+    directory, so runs do not reuse each other's reports or indexes.
+    """
+    openai_url = fakes["openai"].base_url
+    data_dir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ.update({
+        "GITHUB_API_URL": fakes["github"].base_url,
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "OPENAI_API_BASE": f"{openai_url}/v1",
+        "AZURE_OPENAI_KEY": "loadtest",
+        "AZURE_ENDPOINT": openai_url,
+        "AZURE_DEPLOYMENT": "loadtest-gpt-4o",
+        "AZURE_API_VERSION": "2024-12-01-preview",
+        "REPORT_TARGET_URL": f"{fakes['report_sink'].base_url}/reports",
+        "REPORT_DELIVERY_DB": os.path.join(data_dir, "report_delivery.sqlite3"),
+        "INDEX_DIR": os.path.join(data_dir, "indexes"),
+    })
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app():
+    """Imports main.app and serves it with uvicorn on a background thread."""
+    import uvicorn
+    import main
+    from src.config import set_github_token
+
+    set_github_token("loadtest-token")
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="app", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Application server failed to start")
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+# --- Load generation ---
+async def replay(app_url: str, deliveries: list[Delivery], sample_interval: float, timeout: float) -> RunResult:
+    import httpx
+    from src.langgraph_workflow.runner import get_workflow_runner
+
+    runner = get_workflow_runner()
+    result = RunResult()
+    in_flight = 0
+    done = asyncio.Event()
+
+    async def sample_queue_depth():
+        while not done.is_set():
+            result.queue_samples.append((time.perf_counter() - result.started, in_flight,
+                                         runner.queued(), runner.running()))
+            await asyncio.sleep(sample_interval)
+
+    async def send(client, delivery: Delivery):
+        nonlocal in_flight
+        delay = result.started + delivery.offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        in_flight += 1
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                f"{app_url}/webhook",
+                json=delivery.payload,
+                headers={"X-GitHub-Event": delivery.event},
+            )
+            result.statuses[str(response.status_code)] += 1
+            if delivery.event == "pull_request" and response.status_code == 200:
+                # Failed analyses still answer 200; only completed ones count.
+                body = response.json()
+                if body.get("status") == "success":
+                    result.latencies.append(time.perf_counter() - start)
+                elif body.get("status") == "failed":
+                    result.failures[body.get("error") or "unknown error"] += 1
+        except httpx.HTTPError as e:
+            result.statuses[type(e).__name__] += 1
+        finally:
+            in_flight -= 1
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        result.started = time.perf_counter()
+        sampler = asyncio.create_task(sample_queue_depth())
+        await asyncio.gather(*(send(client, d) for d in deliveries))
+        result.finished = time.perf_counter()
+        done.set()
+        await sampler
+    return result
+
+
+# --- Reporting ---
+def summarize(result: RunResult, node_stats: dict, fakes: dict, rss_baseline: int, rss_peak: int) -> dict:
+    elapsed = result.finished - result.started
+    depths = [depth for _, depth, _, _ in result.queue_samples]
+    queued = [queued for _, _, queued, _ in result.queue_samples]
+    running = [running for _, _, _, running in result.queue_samples]
+    return {
+        "requests": sum(result.statuses.values()),
+        "statuses": dict(result.statuses),
+        "elapsed_seconds": elapsed,
+        "analyses": {"succeeded": len(result.latencies), "failed": sum(result.failures.values())},
+        "failures": dict(result.failures),
+        "throughput_per_second": len(result.latencies) / elapsed if elapsed else 0.0,
+        "latency_seconds": {
+            "p50": percentile(result.latencies, 50),
+            "p99": percentile(result.latencies, 99),
+        },
+        "nodes": {
+            name: {
+                "calls": len(stats.durations),
+                "errors": sum(stats.errors.values()),
+                "error_messages": dict(stats.errors),
+                "p50": percentile(stats.durations, 50),
+                "p99": percentile(stats.durations, 99),
+                "totals": dict(stats.totals),
+            }
+            for name, stats in node_stats.items()
+        },
+        "queue_depth": {
+            "max": max(depths, default=0),
+            "mean": sum(depths) / len(depths) if depths else 0.0,
+            "workflows_queued_max": max(queued, default=0),
+            "workflows_queued_mean": sum(queued) / len(queued) if queued else 0.0,
+            "workflows_running_max": max(running, default=0),
+            "workflows_running_mean": sum(running) / len(running) if running else 0.0,
+            # (seconds, requests in flight, workflows queued, workflows running)
+            "samples": result.queue_samples,
+        },
+        "memory": {"baseline_rss_bytes": rss_baseline, "peak_rss_bytes": rss_peak},
+        "fakes": {name: fake.stats() for name, fake in fakes.items()},
+    }
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_summary(summary: dict) -> None:
+    mib = 1024 * 1024
+    analyses = summary["analyses"]
+    print(f"requests: {summary['requests']} {summary['statuses']} in {summary['elapsed_seconds']:.2f}s "
+          f"-> {summary['throughput_per_second']:.2f} PR/s "
+          f"({analyses['succeeded']} succeeded, {analyses['failed']} failed)")
+    if analyses["failed"]:
+        print(f"WARNING: {analyses['failed']} analyses failed and are excluded from throughput and latency:")
+        for error, count in summary["failures"].items():
+            print(f"  {count} x {error}")
+    print(f"end-to-end latency (ms): p50 {_ms(summary['latency_seconds']['p50'])}  "
+          f"p99 {_ms(summary['latency_seconds']['p99'])}")
+    print(f"{'node':<26}{'calls':>8}{'errors':>8}{'p50 ms':>12}{'p99 ms':>12}")
+    for name, node in summary["nodes"].items():
+        totals = " ".join(f"{key}={value:g}" for key, value in sorted(node["totals"].items())
+                          if not key.endswith("_seconds"))
+        print(f"{name:<26}{node['calls']:>8}{node['errors']:>8}{_ms(node['p50']):>12}{_ms(node['p99']):>12}  "
+              f"{totals}")
+    queue = summary["queue_depth"]
+    print(f"requests in flight: max {queue['max']}  mean {queue['mean']:.2f}")
+    print(f"workflows queued:   max {queue['workflows_queued_max']}  mean {queue['workflows_queued_mean']:.2f}")
+    print(f"workflows running:  max {queue['workflows_running_max']}  mean {queue['workflows_running_mean']:.2f}")
+    print(f"peak RSS: {summary['memory']['peak_rss_bytes'] / mib:.1f} MiB "
+          f"(after startup {summary['memory']['baseline_rss_bytes'] / mib:.1f} MiB)")
+    for name, stats in summary["fakes"].items():
+        print(f"{name}: {stats['requests']} rate_limited={stats['rate_limited']} bytes={stats['bytes_sent']}")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    load = p.add_argument_group("load")
+    load.add_argument("--replay", help="JSON lines file of recorded webhook deliveries")
+    load.add_argument("--bursts", type=int, default=3)
+    load.add_argument("--burst-size", type=int, default=10)
+    load.add_argument("--burst-interval", type=float, default=5.0, help="seconds between bursts")
+    load.add_argument("--repos", type=int, default=2, help="distinct repositories in synthetic bursts")
+    load.add_argument("--prewarm", action="store_true",
+                      help="before the measured run, push to each repository's default branch and wait "
+                           "until the pushed commits are indexed")
+    load.add_argument("--timeout", type=float, default=600.0, help="per-request timeout in seconds")
+    load.add_argument("--sample-interval", type=float, default=0.05, help="queue depth sampling period")
+
+    repo = p.add_argument_group("synthetic repository")
+    repo.add_argument("--files-per-repo", type=int, default=50)
+    repo.add_argument("--methods-per-file", type=int, default=8)
+    repo.add_argument("--files-per-pr", type=int, default=3)
+
+    fakes = p.add_argument_group("fake services")
+    for name, latency in (("github", 0.02), ("openai", 0.1)):
+        fakes.add_argument(f"--{name}-latency", type=float, default=latency)
+        fakes.add_argument(f"--{name}-jitter", type=float, default=0.0)
+        fakes.add_argument(f"--{name}-rate-limit", type=int, default=0, help="requests per window, 0 = unlimited")
+        fakes.add_argument(f"--{name}-rate-window", type=float, default=3600.0 if name == "github" else 60.0)
+    fakes.add_argument("--embedding-dimensions", type=int, default=256)
+
+    p.add_argument("--json-out", help="write the full summary, including queue depth samples, to this file")
+    return p.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    deliveries = (load_deliveries(args.replay) if args.replay else
+                  synthetic_deliveries(args.bursts, args.burst_size, args.burst_interval, args.repos))
+
+    fakes = start_fakes(args)
+    server = None
+    try:
+        configure_environment(fakes)
+        node_stats = collect_node_spans()
+        server, _, app_url = start_app()
+        if args.prewarm:
+            pushes = prewarm_deliveries(deliveries)
+            print(f"--- Pre-warming {len(pushes)} repository indexes ---")
+            asyncio.run(replay(app_url, pushes, args.sample_interval, args.timeout))
+            if not wait_for_indexes(pushes, args.timeout):
+                print("WARNING: pre-warm builds did not finish; the run will build indexes itself")
+            node_stats.clear()
+        rss_baseline = peak_rss_bytes()
+
+        print(f"--- Replaying {len(deliveries)} deliveries against {app_url} ---")
+        result = asyncio.run(replay(app_url, deliveries, args.sample_interval, args.timeout))
+        summary = summarize(result, node_stats, fakes, rss_baseline, peak_rss_bytes())
+        print_summary(summary)
+
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+        return 0
+    finally:
+        if server is not None:
+            server.should_exit = True
+        for fake in fakes.values():
+            fake.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
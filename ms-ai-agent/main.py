@@ -4,28 +4,97 @@ Main entry point for the GitHub PR Impact Analyzer application.
 This module sets up a FastAPI web server to receive GitHub webhooks and trigger
 a LangGraph workflow for analyzing the impact of pull requests.
 """
-import uvicorn
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Body
-import httpx
-import os
 
 # --- Project Imports ---
-from src.config import load_environment, set_github_token
-from src.langgraph_workflow.graph import create_workflow
+# The workflow module and the HTTP client are imported on first use so that
+# the service can answer health checks right after the process starts.
+from src.config import load_environment, configure_logging, env_flag
+from src.github_auth.token_provider import get_token_provider
+from src.langgraph_workflow.runner import get_workflow_runner
+from src.repo_index.prewarm import get_prewarmer
+from src.report_delivery.addressees import get_addressee_store
+from src.report_delivery.outbox import get_outbox
+from src.telemetry.metrics import (
+    WEBHOOK_DURATION,
+    WEBHOOK_REQUESTS,
+    render_latest,
+)
+from src.telemetry.spans import configure_tracing, start_trace_span
+
+logger = logging.getLogger(__name__)
 
 # --- Environment and Workflow Setup ---
 # Load environment variables at the start
 load_environment()
+configure_logging()
+configure_tracing()
+
+_workflow_app = None
+_workflow_lock = threading.Lock()
+_warmed_up = threading.Event()
+
+
+def get_workflow_app():
+    """
+    Returns the compiled LangGraph workflow, compiling it on first use.
+    """
+    global _workflow_app
+    if _workflow_app is None:
+        with _workflow_lock:
+            if _workflow_app is None:
+                from src.langgraph_workflow.graph import create_workflow
+                _workflow_app = create_workflow()
+    return _workflow_app
+
+
+def warm_up() -> None:
+    """
+    Preloads the workflow's libraries and parsers and compiles the workflow,
+    so the first webhook does not pay for it. Runs on a background thread.
+    """
+    start = time.perf_counter()
+    try:
+        from src.langgraph_workflow.graph import preload_dependencies
+        preload_dependencies()
+        get_workflow_app()
+        logger.info("Warm-up finished in %.2fs", time.perf_counter() - start)
+    except Exception:
+        logger.exception("Warm-up failed; dependencies will be loaded on first use")
+    finally:
+        _warmed_up.set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if env_flag("WARMUP_ON_STARTUP", default=True):
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        _warmed_up.set()
+    get_addressee_store()
+    outbox = get_outbox()
+    outbox.start()
+    prewarmer = get_prewarmer()
+    prewarmer.start()
+    yield
+    prewarmer.stop()
+    outbox.stop()
+    get_workflow_runner().shutdown()
 
-# Create the LangGraph workflow application
-workflow_app = create_workflow()
 
 # --- FastAPI Web Server ---
 app = FastAPI(
     title="GitHub PR Impact Analyzer",
     description="Receives GitHub webhooks to analyze PR impact using LangGraph.",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -41,119 +110,227 @@ app.add_middleware(
     allow_headers=["*"],      # 모든 HTTP 헤더 허용
 )
 
-is_rag_running: bool = False
-
 @app.get("/rag/status")
 async def get_rag_status():
     """
-    Returns the current status of the RAG workflow.
+    Returns the current status of the RAG workflow: whether any run is in
+    progress, and how many are running or waiting for a workflow thread.
     """
-    return {"is_rag_running": is_rag_running}
+    runner = get_workflow_runner()
+    running, queued = runner.running(), runner.queued()
+    return {"is_rag_running": running > 0, "running": running, "queued": queued}
+
+
+@app.get("/healthz")
+def liveness():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+def readiness(response: Response):
+    """
+    Readiness probe. Webhooks are accepted before warm-up completes (the
+    first one then finishes loading the workflow), unless
+    READY_REQUIRES_WARMUP is set.
+    """
+    warm = _warmed_up.is_set()
+    if not warm and env_flag("READY_REQUIRES_WARMUP"):
+        response.status_code = 503
+        return {"status": "warming up", "warm": warm}
+    return {"status": "ready", "warm": warm}
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Exposes service and workflow metrics in the Prometheus text format.
+    """
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
 
 
 @app.post("/webhook")
 async def handle_webhook(request: Request):
     
-    global is_rag_running
-
     event_type = request.headers.get('X-GitHub-Event')
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        outcome, result = await _handle_event(request, event_type)
+        return result
+    except HTTPException as e:
+        outcome = "rejected" if e.status_code < 500 else "error"
+        raise
+    finally:
+        WEBHOOK_REQUESTS.labels(event=event_type or "unknown", outcome=outcome).inc()
+        WEBHOOK_DURATION.labels(event=event_type or "unknown").observe(time.perf_counter() - start)
 
+
+async def _handle_event(request: Request, event_type: str) -> tuple[str, dict]:
+    """Handles one delivery and returns (metrics outcome, response body)."""
     # Respond to ping events for webhook setup
     if event_type == 'ping':
-        print("--- Received Ping Event ---")
-        return {"status": "ping received"}
+        logger.info("--- Received Ping Event ---")
+        return "ping", {"status": "ping received"}
+
+    # Pushes to the default branch pre-warm the index of the pushed commit
+    if event_type == 'push':
+        return await _handle_push(request)
 
-    # We are only interested in pull request events
+    # Otherwise we are only interested in pull request events
     if event_type != 'pull_request':
-        return {"status": f'Ignoring event: {event_type}'}
+        return "ignored", {"status": f'Ignoring event: {event_type}'}
 
     try:
         payload_data = await request.json()
     except Exception as e:
-        print(f"JSON parsing error: {e}")
+        logger.warning("JSON parsing error: %s", e)
         raise HTTPException(status_code=400, detail="Invalid JSON body")
 
     # Process only relevant pull request actions
     action = payload_data.get('action')
     if action not in ['opened', 'reopened', 'synchronize']:
-        return {"status": f'Ignoring action: {action}'}
+        return "ignored", {"status": f'Ignoring action: {action}'}
 
-    # Initial state for the LangGraph workflow
+    repo_full_name = payload_data['repository']['full_name']
+    repository_id = payload_data['repository'].get('id')
+    installation_id = (payload_data.get('installation') or {}).get('id')
+
+    # Initial state for the LangGraph workflow. The GitHub token is bound here,
+    # so later token changes do not affect this run.
     initial_state = {
-        "repo_full_name": payload_data['repository']['full_name'],
+        "repo_full_name": repo_full_name,
         "pr_number": payload_data['pull_request']['number'],
         "pr_html_url": payload_data['pull_request']['html_url'],
+        "github_token": await asyncio.to_thread(get_token_provider().token_for, repo_full_name, installation_id),
+        "base_sha": (payload_data['pull_request'].get('base') or {}).get('sha'),
     }
 
-    # Asynchronously invoke the workflow
+    # LangGraph's invoke is synchronous, so the workflow runs on a dedicated
+    # workflow thread and the event loop keeps serving probes and other webhooks.
     try:
-        # Note: LangGraph's invoke is synchronous. For a production system,
-        # you might run this in a background task (e.g., with Celery or FastAPI's BackgroundTasks).
-        is_rag_running = True
-        final_state = workflow_app.invoke(initial_state)
-        print("--- Workflow Finished ---")
+        final_state = await get_workflow_runner().run(_run_workflow, initial_state)
+        logger.info("--- Workflow Finished ---")
         report = final_state.get("impact_report", "No report generated.")
-        print("Final Report:", report)
-        await sendMail("bjm222@naver.com", "report for PR", report)
-        return {"status": "success", "report": report}
+        logger.debug("Final Report: %s", report)
+        # Delivery happens on the outbox thread; only the enqueue is awaited here.
+        recipients = await asyncio.to_thread(get_addressee_store().recipients_for, repository_id)
+        head_sha = (payload_data['pull_request'].get('head') or {}).get('sha') or hashlib.sha256(report.encode()).hexdigest()
+        await asyncio.to_thread(
+            get_outbox().enqueue,
+            repo_full_name,
+            recipients,
+            "report for PR",
+            report,
+            f"{repo_full_name}#{initial_state['pr_number']}@{head_sha}",
+        )
+        if final_state.get("error"):
+            return "failed", {"status": "failed", "error": final_state["error"], "report": report}
+        return "success", {"status": "success", "report": report}
     except Exception as e:
-        print(f"--- Workflow Error ---")
-        print(e)
+        logger.exception("--- Workflow Error ---")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        is_rag_running = False
-        print("--- Workflow Background Task Finished ---")
-    
-    
+        logger.info("--- Workflow Background Task Finished ---")
+
+
+def _run_workflow(initial_state: dict) -> dict:
+    """Runs the PR workflow. Blocking: call it from a worker thread, never from the event loop."""
+    with get_prewarmer().foreground(), \
+            start_trace_span("workflow", repo=initial_state["repo_full_name"], pr_number=initial_state["pr_number"]):
+        return get_workflow_app().invoke(initial_state)
+
+
+async def _handle_push(request: Request) -> tuple[str, dict]:
+    """
+    Schedules a background index build for a push to the default branch, so
+    PRs based on the pushed commit find its index ready.
+    """
+    if not env_flag("INDEX_PREWARM", default=True):
+        return "ignored", {"status": "Ignoring event: push"}
+
+    try:
+        payload_data = await request.json()
+    except Exception as e:
+        logger.warning("JSON parsing error: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+    repository = payload_data.get('repository') or {}
+    default_branch = repository.get('default_branch')
+    sha = payload_data.get('after') or ""
+    if not default_branch or payload_data.get('ref') != f"refs/heads/{default_branch}":
+        return "ignored", {"status": f"Ignoring push to {payload_data.get('ref')}"}
+    if payload_data.get('deleted') or not sha.strip("0"):
+        return "ignored", {"status": "Ignoring branch deletion"}
+
+    repo_full_name = repository['full_name']
+    installation_id = (payload_data.get('installation') or {}).get('id')
+    github_token = await asyncio.to_thread(get_token_provider().token_for, repo_full_name, installation_id)
+    if not get_prewarmer().schedule(repo_full_name, sha, github_token):
+        return "ignored", {"status": "Index already built", "sha": sha}
+    return "scheduled", {"status": "Index build scheduled", "sha": sha}
+
+
 @app.post("/set-github-token")
 async def api_set_github_token(payload: dict = Body(...)):
     """
-    Set the global GITHUB_TOKEN at runtime.
+    Set the global GITHUB_TOKEN at runtime, or a token for one repository.
+    The global token replaces GITHUB_TOKEN from the environment. Runs
+    already in progress keep the token they started with.
 
-    Expected JSON body: {"token": "ghp_..."}
+    Expected JSON body: {"token": "ghp_...", "repository": "owner/repo" (optional)}
     """
     token = payload.get("token")
     if not token or not isinstance(token, str):
         raise HTTPException(status_code=400, detail="Missing or invalid 'token' in request body")
+    repository = payload.get("repository")
+    if repository is not None and not isinstance(repository, str):
+        raise HTTPException(status_code=400, detail="Invalid 'repository' in request body")
 
     try:
-        # persist_to_env=True will set os.environ['GITHUB_TOKEN'] as well
-        set_github_token(token)
+        if repository:
+            get_token_provider().set_repository_token(repository, token)
+            return {"status": "success", "message": f"GitHub token set for {repository}"}
+        get_token_provider().set_default_token(token)
         return {"status": "success", "message": "GITHUB_TOKEN set"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def sendMail(to, subject, body):
-    target_url = os.getenv("REPORT_TARGET_URL")
-    
-    if not target_url:
-        print(f"--- [BG Task] REPORT_TARGET_URL not set. Skipping report POST. ---")
-        return
-
-    # 3. Preparar el payload y enviarlo usando httpx
-    report_payload = {
-        "to": to,
-        "subject": subject,
-        "body": body,
-    }
 
-    try:
-        async with httpx.AsyncClient() as client:
-            print(f"--- [BG Task] Sending report to {target_url} ---")
-            response = await client.post(
-                target_url,
-                json=report_payload,
-                headers={"Content-Type": "application/json"},
-                timeout=15.0 # Añade un timeout
-            )
-            # Lanza un error si la respuesta es 4xx o 5xx
-            response.raise_for_status() 
-            print(f"--- [BG Task] Report sent successfully (Status: {response.status_code}) ---")
-            
-    except httpx.RequestError as e:
-        print(f"--- [BG Task] !!! Error sending report to {target_url}: {e} !!! ---")
-    except Exception as e:
-        print(f"--- [BG Task] !!! An unexpected error occurred during report POST: {e} !!! ---")
+@app.get("/repositories/{repository_id}/addressees")
+def list_addressees(repository_id: int):
+    """
+    Lists the report addressees of a repository.
+    """
+    return {"addressees": get_addressee_store().for_repository(repository_id)}
+
+
+@app.post("/repositories/{repository_id}/addressee")
+def add_addressee(repository_id: int, payload: dict = Body(...)):
+    """
+    Adds a report addressee to a repository.
+
+    Expected JSON body: {"name": "...", "email": "..."}
+    """
+    name = payload.get("name")
+    email = payload.get("email")
+    if not isinstance(name, str) or not isinstance(email, str) or "@" not in email:
+        raise HTTPException(status_code=400, detail="Missing or invalid 'name' or 'email' in request body")
+    get_addressee_store().add(repository_id, name, email)
+    return {"status": "success"}
+
+
+@app.delete("/repositories/{repository_id}/addressees")
+def delete_addressee(repository_id: int, email: str):
+    """
+    Removes a report addressee from a repository.
+    """
+    if not get_addressee_store().remove(repository_id, email):
+        raise HTTPException(status_code=404, detail="Addressee not found")
+    return {"status": "success"}
 
 @app.get("/")
 def read_root():
@@ -164,4 +341,5 @@ def read_root():
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,10 +1,12 @@
 """
 Configuration loader for the application.
 """
+import logging
 import os
 from dotenv import load_dotenv
 
 GITHUB_TOKEN = ""
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
 
 def load_environment():
     """
@@ -18,12 +20,21 @@ def load_environment():
         if not os.environ.get(var):
             raise AssertionError(f"{var} environment variable not set.")
 
-# Load environment variables on import
-load_environment()
+def env_flag(name: str, default: bool = False) -> bool:
+    """Reads a boolean environment variable ("1", "true", "yes", "on")."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
 
-# You can also define other configurations here
-# For example:
-# LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+def configure_logging() -> None:
+    """
+    Configures the root logger. The level is read from LOG_LEVEL (default INFO).
+    """
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
 
 def set_github_token(token: str) -> None:
     global GITHUB_TOKEN
@@ -33,4 +44,12 @@ def set_github_token(token: str) -> None:
     
 
 def get_github_token() -> str:
-    return GITHUB_TOKEN
\ No newline at end of file
+    return GITHUB_TOKEN
+
+
+def get_github_api_url() -> str:
+    """
+    Base URL of the GitHub REST API. Overridable with GITHUB_API_URL so the
+    service can be pointed at GitHub Enterprise or a local stand-in.
+    """
+    return os.environ.get("GITHUB_API_URL", DEFAULT_GITHUB_API_URL).rstrip("/")
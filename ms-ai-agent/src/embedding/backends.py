@@ -0,0 +1,102 @@
+"""
+Embedding backend selection.
+
+Backends implement LangChain's `Embeddings` interface, so the vector store code
+is unchanged whichever one is used. The backend is chosen with
+EMBEDDING_BACKEND:
+
+- "openai" (default): OpenAI embeddings API.
+- "local": ONNX code-embedding model run on the CPU, see onnx_backend.py.
+
+Each backend reports the tokens it embeds to the running workflow node span.
+`get_embedding_id` names the configured backend and model, so vectors built
+by one configuration are never queried with another.
+"""
+import functools
+import logging
+import os
+
+from langchain_core.embeddings import Embeddings
+
+from src.telemetry.spans import record
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def get_embeddings() -> Embeddings:
+    """Returns the embedding backend configured by EMBEDDING_BACKEND."""
+    backend = os.environ.get("EMBEDDING_BACKEND", "openai").strip().lower()
+    if backend == "openai":
+        return _openai_embeddings()
+    if backend in ("local", "onnx"):
+        return _local_embeddings()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend!r} (expected 'openai' or 'local')")
+
+
+def get_embedding_id() -> str:
+    """
+    Identifies the configured backend and model from the environment alone,
+    without loading the model.
+    """
+    backend = os.environ.get("EMBEDDING_BACKEND", "openai").strip().lower()
+    if backend == "openai":
+        return f"openai:{os.environ.get('OPENAI_EMBEDDING_MODEL', DEFAULT_OPENAI_EMBEDDING_MODEL)}"
+    if backend in ("local", "onnx"):
+        model_dir = os.path.realpath(os.environ.get("LOCAL_EMBEDDING_MODEL_DIR", ""))
+        return (f"local:{model_dir}:{os.environ.get('LOCAL_EMBEDDING_POOLING', 'mean')}"
+                f":{os.environ.get('LOCAL_EMBEDDING_MAX_LENGTH', '512')}")
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend!r} (expected 'openai' or 'local')")
+
+
+class _UsageRecordingClient:
+    """
+    Wraps the OpenAI embeddings resource and reports the token usage of each
+    API response, so texts are not tokenized a second time just for metrics.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, **kwargs):
+        response = self._client.create(**kwargs)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record("embedding_tokens", usage.total_tokens)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def _openai_embeddings() -> Embeddings:
+    # Imported lazily so that langchain_openai is only loaded when selected.
+    from langchain_openai import OpenAIEmbeddings
+
+    embeddings = OpenAIEmbeddings(
+        model=os.environ.get("OPENAI_EMBEDDING_MODEL", DEFAULT_OPENAI_EMBEDDING_MODEL),
+        disallowed_special=(),
+    )
+    embeddings.client = _UsageRecordingClient(embeddings.client)
+    return embeddings
+
+
+@functools.lru_cache(maxsize=1)
+def _local_embeddings() -> Embeddings:
+    # The model is loaded once per process and shared by all workflow runs.
+    from src.embedding.onnx_backend import OnnxCodeEmbeddings
+
+    model_dir = os.environ.get("LOCAL_EMBEDDING_MODEL_DIR")
+    if not model_dir:
+        raise AssertionError("LOCAL_EMBEDDING_MODEL_DIR environment variable not set.")
+    return OnnxCodeEmbeddings(
+        model_dir=model_dir,
+        max_length=int(os.environ.get("LOCAL_EMBEDDING_MAX_LENGTH", "512")),
+        batch_tokens=int(os.environ.get("LOCAL_EMBEDDING_BATCH_TOKENS", "16384")),
+        max_batch_size=int(os.environ.get("LOCAL_EMBEDDING_MAX_BATCH_SIZE", "64")),
+        workers=int(os.environ.get("LOCAL_EMBEDDING_WORKERS", "2")),
+        pooling=os.environ.get("LOCAL_EMBEDDING_POOLING", "mean"),
+        query_prefix=os.environ.get("LOCAL_EMBEDDING_QUERY_PREFIX", ""),
+    )
+
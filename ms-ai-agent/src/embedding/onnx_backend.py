@@ -0,0 +1,146 @@
+"""
+Local CPU embedding backend running an ONNX code-embedding model.
+
+The model directory must contain `model.onnx` and a Hugging Face
+`tokenizer.json`. Requires the optional `onnxruntime` and `tokenizers`
+packages.
+
+Throughput comes from three things:
+- length bucketing: texts are sorted by token count so each batch pads to a
+  similar length;
+- dynamic batching: batches are filled up to a padded-token budget instead of
+  a fixed size, so short chunks form large batches and long ones small;
+- multi-threaded inference: batches run concurrently on a thread pool, and
+  onnxruntime splits each batch across its intra-op threads.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.telemetry.spans import record
+
+logger = logging.getLogger(__name__)
+
+
+class OnnxCodeEmbeddings(Embeddings):
+    """Embeds texts with an ONNX transformer model on the CPU."""
+
+    def __init__(self, model_dir: str, max_length: int = 512, batch_tokens: int = 16384,
+                 max_batch_size: int = 64, workers: int = 2, intra_op_threads: Optional[int] = None,
+                 pooling: str = "mean", normalize: bool = True, query_prefix: str = ""):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=local requires the 'onnxruntime' and 'tokenizers' packages."
+            ) from e
+
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Unsupported pooling: {pooling!r} (expected 'mean' or 'cls')")
+
+        self.max_length = max_length
+        self.batch_tokens = max(batch_tokens, max_length)
+        self.max_batch_size = max_batch_size
+        self.pooling = pooling
+        self.normalize = normalize
+        self.query_prefix = query_prefix
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        padding = self._tokenizer.padding
+        self._pad_id = padding["pad_id"] if padding else 0
+        self._tokenizer.no_padding()
+        self._tokenizer.enable_truncation(max_length)
+
+        workers = max(1, workers)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads or max(1, (os.cpu_count() or 1) // workers)
+        self._session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._output_name = self._session.get_outputs()[0].name
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="onnx-embed")
+        logger.info("Loaded local embedding model from %s (%d workers x %d threads)",
+                    model_dir, workers, options.intra_op_num_threads)
+
+    # --- Embeddings interface ---
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([self.query_prefix + text])[0].tolist()
+
+    # --- Implementation ---
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        lengths = np.fromiter((len(e.ids) for e in encodings), dtype=np.int64, count=len(encodings))
+        record("embedding_tokens", int(lengths.sum()))
+
+        futures = [
+            (batch, self._executor.submit(self._run_batch, [encodings[i] for i in batch], int(lengths[batch].max())))
+            for batch in self._batches(lengths)
+        ]
+        result = None
+        for batch, future in futures:
+            vectors = future.result()
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[batch] = vectors
+        return result
+
+    def _batches(self, lengths: np.ndarray) -> list[np.ndarray]:
+        """
+        Groups text indexes, sorted by token count, into batches whose padded
+        size (batch size x longest member) stays within the token budget.
+        """
+        order = np.argsort(lengths, kind="stable")
+        batches = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            # `order` is ascending, so the longest member is always the last one.
+            if end < len(order):
+                next_size = end + 1 - start
+                if next_size <= self.max_batch_size and next_size * lengths[order[end]] <= self.batch_tokens:
+                    continue
+            batches.append(order[start:end])
+            start = end
+        return batches
+
+    def _run_batch(self, encodings: list, seq_len: int) -> np.ndarray:
+        seq_len = max(seq_len, 1)
+        input_ids = np.full((len(encodings), seq_len), self._pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), seq_len), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            n = len(encoding.ids)
+            input_ids[row, :n] = encoding.ids
+            attention_mask[row, :n] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        feeds = {name: value for name, value in feeds.items() if name in self._input_names}
+
+        output = self._session.run([self._output_name], feeds)[0]
+        if output.ndim == 3:
+            output = self._pool(output, attention_mask)
+        output = output.astype(np.float32, copy=False)
+        if self.normalize:
+            norms = np.linalg.norm(output, axis=1, keepdims=True)
+            output = output / np.maximum(norms, 1e-12)
+        return output
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
@@ -0,0 +1,330 @@
+"""
+GitHub token provider.
+
+Chooses the token a job uses when it is enqueued, in this order:
+1. a GitHub App installation token for the repository (GITHUB_APP_ID and
+   GITHUB_APP_PRIVATE_KEY / GITHUB_APP_PRIVATE_KEY_PATH), minted on demand
+   and cached until shortly before it expires;
+2. a token registered for the repository;
+3. the token in the pool (GITHUB_TOKEN_POOL plus the default token) with the
+   most rate-limit budget left.
+
+The default token is the one set through /set-github-token. It replaces the
+GITHUB_TOKEN environment variable, which is only used until a token has been
+set at runtime.
+
+Rate-limit state is learned from the X-RateLimit-* response headers and from
+the number of requests each job reports. Tokens GitHub rejects are passed
+over: a 401 takes a token out of rotation until it is set again, and a 403
+(other than an exhausted rate limit) or 404 for a repository keeps it from
+being chosen for that repository for a while.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Mapping, Optional
+
+from src.config import get_github_api_url, get_github_token, set_github_token
+
+logger = logging.getLogger(__name__)
+
+# Assumed budget of a token GitHub has not reported on yet.
+DEFAULT_RATE_LIMIT = 5000
+# Installation tokens are replaced this many seconds before they expire.
+TOKEN_REFRESH_MARGIN = 300
+# Seconds a token that got a 403/404 for a repository is not chosen for it.
+DENIED_TTL = 600
+# Seconds a repository the app is not installed on is not looked up again.
+NO_INSTALLATION_TTL = 600
+
+
+def _mask(token: str) -> str:
+    return f"...{token[-4:]}" if token else "<empty>"
+
+
+@dataclass
+class _TokenState:
+    remaining: Optional[int] = None
+    reset_at: float = 0.0
+    last_used: float = 0.0
+    invalid: bool = False
+
+
+class TokenPool:
+    """Tracks the rate-limit budget of tokens and picks the least used one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: dict[str, _TokenState] = {}
+        self._denied: dict[tuple[str, str], float] = {}
+
+    def acquire(self, candidates: Iterable[str], repo_full_name: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the candidate with the most remaining requests, preferring the
+        least recently used on ties. When every candidate is exhausted, returns
+        the one whose window resets first. Rejected tokens are only returned
+        when no other candidate is left.
+        """
+        now = time.time()
+        with self._lock:
+            best, best_key = None, None
+            for token in dict.fromkeys(candidates):
+                if not token:
+                    continue
+                state = self._states.setdefault(token, _TokenState())
+                if state.reset_at and now >= state.reset_at:
+                    state.remaining, state.reset_at = None, 0.0
+                remaining = DEFAULT_RATE_LIMIT if state.remaining is None else state.remaining
+                usable = self._usable(token, repo_full_name, now)
+                key = (usable, remaining > 0, remaining if remaining > 0 else -state.reset_at, -state.last_used)
+                if best_key is None or key > best_key:
+                    best, best_key = token, key
+            if best is not None:
+                self._states[best].last_used = now
+                if not best_key[0]:
+                    logger.warning("Every candidate token was rejected by GitHub; using %s anyway", _mask(best))
+            return best
+
+    def _usable(self, token: str, repo_full_name: Optional[str], now: float) -> bool:
+        state = self._states.get(token)
+        if state is not None and state.invalid:
+            return False
+        if repo_full_name is None:
+            return True
+        key = (token, repo_full_name.lower())
+        until = self._denied.get(key)
+        if until is not None and now >= until:
+            del self._denied[key]
+            until = None
+        return until is None
+
+    def usable(self, token: str, repo_full_name: Optional[str] = None) -> bool:
+        with self._lock:
+            return self._usable(token, repo_full_name, time.time())
+
+    def invalidate(self, token: str) -> None:
+        """Takes a token GitHub does not accept (401) out of rotation."""
+        with self._lock:
+            self._states.setdefault(token, _TokenState()).invalid = True
+        logger.warning("GitHub rejected token %s; it will not be used until it is set again", _mask(token))
+
+    def deny(self, token: str, repo_full_name: str) -> None:
+        """Keeps a token that has no access to a repository from being chosen for it."""
+        with self._lock:
+            self._denied[(token, repo_full_name.lower())] = time.time() + DENIED_TTL
+        logger.warning("Token %s has no access to %s", _mask(token), repo_full_name)
+
+    def forget(self, token: str) -> None:
+        """Drops everything known about a token, e.g. after it was set again."""
+        with self._lock:
+            self._states.pop(token, None)
+            for key in [key for key in self._denied if key[0] == token]:
+                del self._denied[key]
+
+    def update(self, token: str, headers: Mapping[str, str]) -> None:
+        """Records the X-RateLimit-Remaining / X-RateLimit-Reset headers of a response."""
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if not token or remaining is None:
+            return
+        with self._lock:
+            state = self._states.setdefault(token, _TokenState())
+            state.remaining = int(remaining)
+            if reset is not None:
+                state.reset_at = float(reset)
+
+    def consume(self, token: str, requests: int) -> None:
+        """Lowers the known budget of `token` for requests whose headers were not seen."""
+        if not token or requests <= 0:
+            return
+        with self._lock:
+            state = self._states.setdefault(token, _TokenState())
+            if state.remaining is not None:
+                state.remaining = max(0, state.remaining - requests)
+
+    def remaining(self, token: str) -> Optional[int]:
+        with self._lock:
+            state = self._states.get(token)
+            return state.remaining if state else None
+
+
+class InstallationTokenMinter:
+    """Mints and caches GitHub App installation access tokens."""
+
+    def __init__(self, app_id: str, private_key: str):
+        self.app_id = app_id
+        self.private_key = private_key
+        self._lock = threading.Lock()
+        self._tokens: dict[int, tuple[str, float]] = {}
+        # Installation ids by repository, and when a repository was found to have none.
+        self._installations: dict[str, int] = {}
+        self._not_installed: dict[str, float] = {}
+
+    def _app_jwt(self) -> str:
+        import jwt
+
+        now = int(time.time())
+        # Backdate iat to allow for clock drift; GitHub caps exp at 10 minutes.
+        payload = {"iat": now - 60, "exp": now + 540, "iss": self.app_id}
+        return jwt.encode(payload, self.private_key, algorithm="RS256")
+
+    def _app_headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self._app_jwt()}",
+            "Accept": "application/vnd.github+json",
+        }
+
+    def installation_id_for(self, repo_full_name: str) -> Optional[int]:
+        """
+        Looks up (and caches) the installation of the app on a repository. A
+        repository without one is looked up again after NO_INSTALLATION_TTL,
+        so installing the app later takes effect without a restart.
+        """
+        import requests
+
+        with self._lock:
+            if repo_full_name in self._installations:
+                return self._installations[repo_full_name]
+            checked_at = self._not_installed.get(repo_full_name)
+            if checked_at is not None and time.monotonic() - checked_at < NO_INSTALLATION_TTL:
+                return None
+
+        response = requests.get(f"{get_github_api_url()}/repos/{repo_full_name}/installation",
+                                headers=self._app_headers(), timeout=10)
+        installation_id = response.json()["id"] if response.status_code == 200 else None
+        if response.status_code not in (200, 404):
+            response.raise_for_status()
+
+        with self._lock:
+            if installation_id is None:
+                self._not_installed[repo_full_name] = time.monotonic()
+            else:
+                self._installations[repo_full_name] = installation_id
+                self._not_installed.pop(repo_full_name, None)
+        return installation_id
+
+    def token_for_installation(self, installation_id: int) -> str:
+        """Returns a cached installation token, minting a new one when it is about to expire."""
+        import requests
+
+        with self._lock:
+            cached = self._tokens.get(installation_id)
+            if cached and cached[1] - TOKEN_REFRESH_MARGIN > time.time():
+                return cached[0]
+
+        response = requests.post(f"{get_github_api_url()}/app/installations/{installation_id}/access_tokens",
+                                 headers=self._app_headers(), timeout=10)
+        response.raise_for_status()
+        body = response.json()
+        expires_at = datetime.fromisoformat(body["expires_at"].replace("Z", "+00:00")).timestamp()
+
+        with self._lock:
+            self._tokens[installation_id] = (body["token"], expires_at)
+        logger.info("Minted installation token for installation %s", installation_id)
+        return body["token"]
+
+    def forget_token(self, token: str) -> None:
+        """Drops a cached installation token, so the next request mints a new one."""
+        with self._lock:
+            for installation_id, (cached, _) in list(self._tokens.items()):
+                if cached == token:
+                    del self._tokens[installation_id]
+
+
+class GitHubTokenProvider:
+    """Resolves the token a job should use for a repository."""
+
+    def __init__(self, pool_tokens: Iterable[str] = (), minter: Optional[InstallationTokenMinter] = None,
+                 environment_token: str = ""):
+        self.pool = TokenPool()
+        self.minter = minter
+        self.environment_token = environment_token
+        self._lock = threading.Lock()
+        self._pool_tokens: list[str] = list(dict.fromkeys(t for t in pool_tokens if t))
+        self._repository_tokens: dict[str, str] = {}
+
+    def default_token(self) -> str:
+        """The token set at runtime, or GITHUB_TOKEN until one has been set."""
+        return get_github_token() or self.environment_token
+
+    def set_default_token(self, token: str) -> None:
+        """Replaces the default token (and GITHUB_TOKEN from the environment)."""
+        set_github_token(token)
+        self.pool.forget(token)
+
+    def add_pool_token(self, token: str) -> None:
+        with self._lock:
+            if token and token not in self._pool_tokens:
+                self._pool_tokens.append(token)
+        self.pool.forget(token)
+
+    def set_repository_token(self, repo_full_name: str, token: str) -> None:
+        with self._lock:
+            self._repository_tokens[repo_full_name.lower()] = token
+        self.pool.forget(token)
+
+    def token_for(self, repo_full_name: str, installation_id: Optional[int] = None) -> str:
+        """
+        Returns the token to bind to a job for `repo_full_name`. Blocking: may
+        call the GitHub API to mint an installation token.
+        """
+        if self.minter is not None:
+            try:
+                installation_id = installation_id or self.minter.installation_id_for(repo_full_name)
+                if installation_id:
+                    return self.minter.token_for_installation(installation_id)
+            except Exception as e:
+                logger.warning("Could not get installation token for %s: %s", repo_full_name, e)
+
+        with self._lock:
+            repository_token = self._repository_tokens.get(repo_full_name.lower())
+            candidates = [*self._pool_tokens, self.default_token()]
+        if repository_token and self.pool.usable(repository_token, repo_full_name):
+            return repository_token
+        return self.pool.acquire(candidates, repo_full_name) or ""
+
+    def record_response(self, token: str, headers: Mapping[str, str], status_code: Optional[int] = None,
+                        repo_full_name: Optional[str] = None) -> None:
+        """
+        Records the rate-limit headers of a response and demotes the token
+        when GitHub rejected it.
+        """
+        self.pool.update(token, headers)
+        if not token:
+            return
+        if status_code == 401:
+            self.pool.invalidate(token)
+            if self.minter is not None:
+                self.minter.forget_token(token)
+        elif repo_full_name and (status_code == 404 or
+                                 (status_code == 403 and headers.get("X-RateLimit-Remaining") != "0")):
+            self.pool.deny(token, repo_full_name)
+
+    def record_requests(self, token: str, requests: int) -> None:
+        self.pool.consume(token, requests)
+
+
+def _minter_from_environment() -> Optional[InstallationTokenMinter]:
+    app_id = os.environ.get("GITHUB_APP_ID")
+    if not app_id:
+        return None
+    private_key = os.environ.get("GITHUB_APP_PRIVATE_KEY", "").replace("\\n", "\n")
+    key_path = os.environ.get("GITHUB_APP_PRIVATE_KEY_PATH")
+    if not private_key and key_path:
+        with open(key_path, encoding="utf-8") as f:
+            private_key = f.read()
+    if not private_key:
+        raise AssertionError("GITHUB_APP_ID is set but GITHUB_APP_PRIVATE_KEY(_PATH) is not.")
+    return InstallationTokenMinter(app_id, private_key)
+
+
+@functools.lru_cache(maxsize=1)
+def get_token_provider() -> GitHubTokenProvider:
+    """Returns the process-wide provider, configured from the environment on first use."""
+    pool_tokens = [t.strip() for t in os.environ.get("GITHUB_TOKEN_POOL", "").split(",")]
+    return GitHubTokenProvider(pool_tokens, _minter_from_environment(),
+                               environment_token=os.environ.get("GITHUB_TOKEN", ""))
@@ -1,22 +1,38 @@
 """
 Defines the LangGraph workflow for analyzing GitHub pull requests.
+
+The heavy client libraries (langchain_community, openai, the embedding
+backend, langgraph) are imported inside the nodes that use them so
+that importing this module stays cheap; `preload_dependencies` loads them
+ahead of time.
+
+The load/chunk/embed nodes build a read-only, memory-mapped index of the base
+commit (see src.repo_index), which is all the later nodes use. Indexes are
+cached on disk per commit, so a PR whose base commit is already indexed goes
+straight from `lookup_index` to the usage search. Of several PRs missing the
+same index, the first claims its build and the others wait for it.
 """
+import functools
+import logging
 import os
 import re
-import requests
 from typing import TypedDict, List, Optional, Literal
 
-from langgraph.graph import StateGraph, END
-from langchain_core.prompts import ChatPromptTemplate
-from openai import AzureOpenAI
-from langchain_text_splitters import PythonCodeTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import GithubFileLoader
 from langchain_core.documents import Document
 
+from src.embedding.backends import get_embeddings
+from src.util.diff import unified_diff
 from src.util.parser import java_parser
-from src.config import get_github_token
+from src.config import get_github_token, get_github_api_url
+from src.github_auth.token_provider import get_token_provider
+from src.repo_index.cache import get_index_cache
+from src.telemetry.spans import node_span, record, timed
+
+logger = logging.getLogger(__name__)
+
+# Seconds a PR analysis waits for an index build of its base commit that is
+# already in progress.
+DEFAULT_INDEX_WAIT_TIMEOUT = 120.0
 
 # --- LangGraph State ---
 class GraphState(TypedDict):
@@ -27,36 +43,57 @@ class GraphState(TypedDict):
         repo_full_name: The full name of the repository (e.g., "owner/repo").
         pr_number: The pull request number.
         pr_html_url: The URL of the pull request.
+        github_token: The GitHub token bound to this job when it was enqueued.
+        base_sha: The commit the repository is loaded at (the PR's base commit).
         pr_files: A list of files changed in the PR.
-        repo_docs: Documents loaded from the repository's base branch.
-        chunks: Code chunks created from the repo documents.
-        vector_store: The vector store containing embedded chunks.
+        repo_docs: Documents loaded from the base commit, only kept until they are indexed.
+        index: The repository index of the base commit (chunks, vectors and file contents).
         impact_report: The final impact analysis report.
         error: Any error messages that occur during the process.
         language: The primary language of the repository ('python' or 'java').
+        building_index: Whether this run claimed the index build of the base commit.
     """
     repo_full_name: str
     pr_number: int
     pr_html_url: str
+    github_token: Optional[str] = None
+    base_sha: Optional[str] = None
     pr_files: Optional[List[dict]] = None
     repo_docs: Optional[List[Document]] = None
-    chunks: Optional[List[Document]] = None
-    vector_store: Optional[object] = None
+    index: Optional[object] = None
     impact_report: Optional[str] = None
     error: Optional[str] = None
     language: Optional[Literal["python", "java"]] = None
     impact_context: Optional[str] = None
+    building_index: bool = False
+
+
+# --- Helpers ---
+def preload_dependencies() -> None:
+    """Imports the libraries the nodes load lazily and loads the tree-sitter grammar."""
+    import requests  # noqa: F401
+    import langgraph.graph  # noqa: F401
+    from openai import AzureOpenAI  # noqa: F401
+    from langchain_text_splitters import PythonCodeTextSplitter  # noqa: F401
+    from langchain_community.document_loaders import GithubFileLoader  # noqa: F401
+    from src.repo_index import index_file  # noqa: F401
+
+    java_parser.get_language()
+    get_embeddings()
 
 
 # --- Graph Nodes ---
+@node_span("get_pr_details")
 def get_pr_details(state: GraphState) -> GraphState:
     """Fetches the list of changed files from a GitHub pull request."""
-    print("--- (1) Fetching PR Details ---")
+    import requests
+
+    logger.info("--- (1) Fetching PR Details ---")
     repo_full_name = state["repo_full_name"]
     pr_number = state["pr_number"]
-    github_token = get_github_token()
+    github_token = state.get("github_token") or get_github_token()
     
-    api_url = f"https://api.github.com/repos/{repo_full_name}/pulls/{pr_number}/files"
+    api_url = f"{get_github_api_url()}/repos/{repo_full_name}/pulls/{pr_number}/files"
     headers = {
         "Authorization": f"Bearer {github_token}",
         "Accept": "application/vnd.github.v3+json",
@@ -64,87 +101,165 @@ def get_pr_details(state: GraphState) -> GraphState:
 
     try:
         response = requests.get(api_url, headers=headers)
+        record("github_requests")
+        record("github_bytes", len(response.content))
+        get_token_provider().record_response(github_token, response.headers, response.status_code, repo_full_name)
         response.raise_for_status()
         files = response.json()
+        # Binary files have no "patch"; renames carry the base path in "previous_filename".
         pr_files = [
-            {"filename": file["filename"], "patch": file["patch"]}
+            {
+                "filename": file["filename"],
+                "patch": file.get("patch", ""),
+                "status": file.get("status", "modified"),
+                "previous_filename": file.get("previous_filename"),
+            }
             for file in files
         ]
         
-        print(f"Found {len(pr_files)} changed files in PR #{pr_number}.")
+        logger.info("Found %d changed files in PR #%s.", len(pr_files), pr_number)
         
         state["pr_files"] = pr_files
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching PR files: {e}")
+        logger.error("Error fetching PR files: %s", e)
         state["error"] = f"Failed to fetch PR files: {e}"
 
     return state
 
+@node_span("lookup_index")
+def lookup_index(state: GraphState) -> GraphState:
+    """Reuses the cached index of the PR's base commit, if there is one."""
+    logger.info("--- (1a) Looking Up Repository Index ---")
+    if state.get("error") or not state.get("base_sha"):
+        return state
+
+    cache = get_index_cache()
+    repo_full_name, base_sha = state["repo_full_name"], state["base_sha"]
+    wait = float(os.environ.get("INDEX_WAIT_TIMEOUT", DEFAULT_INDEX_WAIT_TIMEOUT))
+    index = cache.get(repo_full_name, base_sha, wait=wait)
+    if index is None and cache.begin_build(repo_full_name, base_sha):
+        # A build may have finished between the lookup and the claim.
+        index = cache.get(repo_full_name, base_sha)
+        if index is not None:
+            cache.end_build(repo_full_name, base_sha)
+        else:
+            state["building_index"] = True
+    elif index is None:
+        # Another analysis started building it since the lookup.
+        index = cache.get(repo_full_name, base_sha, wait=wait)
+    if index is None:
+        logger.info("No index for %s@%s, building one.", repo_full_name, base_sha[:12])
+        return state
+
+    logger.info("Using cached index for %s@%s.", state["repo_full_name"], state["base_sha"][:12])
+    state["index"] = index
+    state["language"] = index.language
+    return state
+
+@node_span("load_repository")
 def load_repository(state: GraphState) -> GraphState:
-    """Loads all relevant files (.py, .java) from the repository."""
-    print("--- (2) Loading Repository Files ---")
+    """Loads all relevant files (.py, .java) from the repository at the base commit."""
+    from langchain_community.document_loaders import GithubFileLoader
+
+    logger.info("--- (2) Loading Repository Files ---")
     if state.get("error"):
         return state
 
     repo_full_name = state["repo_full_name"]
-    github_token = get_github_token()
+    github_token = state.get("github_token") or get_github_token()
 
     try:
         loader = GithubFileLoader(
             repo=repo_full_name,
             access_token=github_token,
-            github_api_url="https://api.github.com",
-            branch="main",
+            github_api_url=get_github_api_url(),
+            branch=state.get("base_sha") or "main",
             file_filter=lambda file_path: (file_path.endswith(".py") or file_path.endswith(".java")) and \
                                         all(part not in file_path for part in ["__pycache__", ".venv", ".git", "target"])
         )
         repo_docs = loader.load()
-        print(f"Loaded {len(repo_docs)} documents from the repo.")
+        # GithubFileLoader makes one tree request plus one contents request per
+        # file; the byte count covers the decoded file contents.
+        record("github_requests", 1 + len(repo_docs))
+        get_token_provider().record_requests(github_token, 1 + len(repo_docs))
+        record("github_bytes", sum(len(doc.page_content.encode()) for doc in repo_docs))
+        logger.info("Loaded %d documents from the repo.", len(repo_docs))
         state["repo_docs"] = repo_docs
     except Exception as e:
-        print(f"Error loading repository: {e}")
+        logger.error("Error loading repository: %s", e)
         state["error"] = f"Failed to load repository: {e}"
     
     return state
 
+@node_span("determine_language")
 def determine_language(state: GraphState) -> GraphState:
     """Determines the primary language of the PR based on file extensions."""
-    print("--- (2a) Determining Language ---")
+    logger.info("--- (2a) Determining Language ---")
     if state.get("error") or not state.get("repo_docs"):
         return state
 
     if any(doc.metadata.get("source", "").endswith(".java") for doc in state["repo_docs"]):
-        print("Language is Java")
+        logger.info("Language is Java")
         state["language"] = "java"
     else:
-        print("Language is Python")
+        logger.info("Language is Python")
         state["language"] = "python"
     return state
 
+def _ends_index_build(node):
+    """
+    Ends the index build claimed in `lookup_index` once the node building it
+    has run, whether or not it succeeded, so PRs waiting for it move on.
+    """
+    @functools.wraps(node)
+    def wrapper(state: GraphState) -> GraphState:
+        try:
+            return node(state)
+        finally:
+            if state.get("building_index"):
+                state["building_index"] = False
+                get_index_cache().end_build(state["repo_full_name"], state["base_sha"])
+    return wrapper
+
+def _build_index(state: GraphState, chunks: List[Document]) -> None:
+    """
+    Embeds the chunks and writes the index of the base commit, which replaces
+    the loaded documents in the state.
+    """
+    vectors = get_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+    state["index"] = get_index_cache().store(
+        state["repo_full_name"], state.get("base_sha"), state["language"], state["repo_docs"], chunks, vectors,
+    )
+    state["repo_docs"] = None
+
+@node_span("chunk_and_embed_python")
+@_ends_index_build
 def chunk_and_embed_python(state: GraphState) -> GraphState:
-    """Chunks Python documents and creates a vector store."""
-    print("--- (3a) Chunking and Embedding Python ---")
+    """Chunks Python documents and builds the repository index."""
+    from langchain_text_splitters import PythonCodeTextSplitter
+
+    logger.info("--- (3a) Chunking and Embedding Python ---")
     repo_docs = state["repo_docs"]
     
     try:
         text_splitter = PythonCodeTextSplitter(chunk_size=1000, chunk_overlap=100)
         chunks = text_splitter.split_documents(repo_docs)
-        print(f"Created {len(chunks)} code chunks.")
+        record("files_parsed", len(repo_docs))
+        record("chunks_produced", len(chunks))
+        logger.info("Created %d code chunks.", len(chunks))
 
-        embeddings = OpenAIEmbeddings(disallowed_special=())
-        vector_store = FAISS.from_documents(chunks, embeddings)
-        
-        state["chunks"] = chunks
-        state["vector_store"] = vector_store
-        print("Successfully created vector store for Python.")
+        _build_index(state, chunks)
+        logger.info("Successfully built the index for Python.")
     except Exception as e:
-        print(f"Error during Python chunking and embedding: {e}")
+        logger.error("Error during Python chunking and embedding: %s", e)
         state["error"] = f"Failed to chunk and embed Python: {e}"
     return state
 
+@node_span("chunk_and_embed_java")
+@_ends_index_build
 def chunk_and_embed_java(state: GraphState) -> GraphState:
-    """Chunks Java documents and creates a vector store."""
-    print("--- (3b) Chunking and Embedding Java ---")
+    """Chunks Java documents and builds the repository index."""
+    logger.info("--- (3b) Chunking and Embedding Java ---")
     if state.get("error") or not state.get("repo_docs"):
         return state
 
@@ -153,31 +268,42 @@ def chunk_and_embed_java(state: GraphState) -> GraphState:
     try:
         all_chunks = []
         for doc in repo_docs:
-            print(f"Processing doc: {doc.metadata.get('source')}")
+            logger.debug("Processing doc: %s", doc.metadata.get('source'))
             if doc.metadata.get('source', '').endswith(".java"):
                 chunks = java_parser.get_class_and_method_chunks(doc)
+                record("files_parsed")
                 all_chunks.extend(chunks)
         
-        print(f"Created {len(all_chunks)} code chunks for Java.")
+        record("chunks_produced", len(all_chunks))
+        logger.info("Created %d code chunks for Java.", len(all_chunks))
 
-        embeddings = OpenAIEmbeddings(disallowed_special=())
-        vector_store = FAISS.from_documents(all_chunks, embeddings)
-        
-        state["chunks"] = all_chunks
-        state["vector_store"] = vector_store
-        print("Successfully created vector store for Java.")
+        _build_index(state, all_chunks)
+        logger.info("Successfully built the index for Java.")
 
     except Exception as e:
-        print(f"Error during Java chunking and embedding: {e}")
+        logger.error("Error during Java chunking and embedding: %s", e)
         state["error"] = f"Failed to chunk and embed Java: {e}"
 
     return state
 
+def _format_file_context(filename: str, patch: str, usages: dict[str, list[str]]) -> str:
+    """Formats the context for one changed file, including its diff only once."""
+    symbols = ", ".join(f"`{symbol}`" for symbol in usages)
+    sections = [
+        f"Change in `{filename}` related to symbols {symbols}:\n"
+        f"**Diff:**\n```diff\n{patch}\n```"
+    ]
+    for symbol, snippets in usages.items():
+        sections.append(f"**Potential Usages of `{symbol}`:**\n" + "\n".join(snippets))
+    return "\n".join(sections)
+
+@node_span("find_usages_python")
 def find_usages_python(state: GraphState) -> GraphState:
     """Identifies changed Python symbols and finds their usages."""
-    print("--- (4a) Finding Usages of Changed Python Code ---")
+    logger.info("--- (4a) Finding Usages of Changed Python Code ---")
     pr_files = state["pr_files"]
-    vector_store = state["vector_store"]
+    index = state["index"]
+    embeddings = get_embeddings()
     impact_context = []
 
     for file in pr_files:
@@ -186,75 +312,83 @@ def find_usages_python(state: GraphState) -> GraphState:
             continue
 
         changed_symbols = re.findall(r"(?:class|def)\s+([\w_]+)", patch)
+        usages = {}
         
-        for symbol in set(changed_symbols):
-            print(f"Analyzing symbol: {symbol} in file {file['filename']}")
-            retriever = vector_store.as_retriever()
-            relevant_docs = retriever.invoke(symbol)
+        for symbol in dict.fromkeys(changed_symbols):
+            logger.info("Analyzing symbol: %s in file %s", symbol, file['filename'])
+            with timed("retrieval"):
+                relevant_docs = index.similarity_search(symbol, embeddings)
+            record("retrievals")
             
-            usage_snippets = [
+            usages[symbol] = [
                 f"- Usage in `{doc.metadata['source']}`:\n```python\n{doc.page_content}\n```"
                 for doc in relevant_docs
                 if f"def {symbol}" not in doc.page_content and f"class {symbol}" not in doc.page_content
             ]
-            
-            context = (
-                f"Change in `{file['filename']}` related to symbol `{symbol}`:\n"
-                f"**Diff:**\n```diff\n{patch}\n```\n"
-                f"**Potential Usages:**\n" + "\n".join(usage_snippets)
-            )
-            impact_context.append(context)
+
+        if usages:
+            impact_context.append(_format_file_context(file["filename"], patch, usages))
 
     state["impact_context"] = "\n\n---\n\n".join(impact_context)
     return state
 
+@node_span("find_usages_java")
 def find_usages_java(state: GraphState) -> GraphState:
     """Identifies changed Java symbols and finds their usages."""
-    print("--- (4b) Finding Usages of Changed Java Code ---")
-    if state.get("error") or not state.get("vector_store"):
+    logger.info("--- (4b) Finding Usages of Changed Java Code ---")
+    if state.get("error") or not state.get("index"):
         return state
 
     pr_files = state["pr_files"]
-    repo_docs_map = {doc.metadata["path"]: doc.page_content for doc in state["repo_docs"]}
-    vector_store = state["vector_store"]
+    index = state["index"]
+    embeddings = get_embeddings()
     impact_context = []
 
     for file in pr_files:
         filename = file.get("filename")
-        patch = file.get("patch", "")
-        if not patch or not filename or not filename.endswith(".java"):
+        if not filename or not filename.endswith(".java"):
+            continue
+
+        try:
+            diff = unified_diff.from_pr_file(file)
+        except unified_diff.PatchError as e:
+            logger.warning("Skipping %s, malformed patch: %s", filename, e)
+            continue
+        if not diff.hunks:
             continue
 
-        file_content = repo_docs_map.get(filename)
-        if not file_content:
+        # New files have no base content; renamed files are looked up by their old path.
+        file_content = "" if diff.status == "added" else index.document_content(diff.old_path)
+        if file_content is None:
             continue
 
-        changed_symbols = java_parser.get_changed_symbols_from_patch(patch, file_content)
+        changed_symbols = java_parser.get_changed_symbols(diff, file_content)
+        usages = {}
 
-        for symbol in set(changed_symbols):
-            print(f"Analyzing symbol: {symbol} in file {filename}")
-            retriever = vector_store.as_retriever()
-            relevant_docs = retriever.invoke(symbol)
+        for symbol in sorted(set(changed_symbols)):
+            logger.info("Analyzing symbol: %s in file %s", symbol, filename)
+            with timed("retrieval"):
+                relevant_docs = index.similarity_search(symbol, embeddings)
+            record("retrievals")
             
-            usage_snippets = [
+            usages[symbol] = [
                 f"- Usage in `{doc.metadata['source']}` (Line {doc.metadata['start_line']}):\n```java\n{doc.page_content}\n```"
                 for doc in relevant_docs
                 if symbol not in doc.metadata.get("symbol_name", "") # Basic check to avoid self-reference
             ]
-            
-            context = (
-                f"Change in `{filename}` related to symbol `{symbol}`:\n"
-                f"**Diff:**\n```diff\n{patch}\n```\n"
-                f"**Potential Usages:**\n" + "\n".join(usage_snippets)
-            )
-            impact_context.append(context)
+
+        if usages:
+            impact_context.append(_format_file_context(filename, diff.patch, usages))
 
     state["impact_context"] = "\n\n---\n\n".join(impact_context)
     return state
 
+@node_span("generate_report")
 def generate_report(state: GraphState) -> GraphState:
     """Generates a final impact analysis report using the LLM."""
-    print("--- (5) Generating Impact Report ---")
+    from openai import AzureOpenAI
+
+    logger.info("--- (5) Generating Impact Report ---")
     if state.get("error") or not state.get("impact_context"):
         state["impact_report"] = "Could not generate a report due to earlier errors or no impact context found."
         return state
@@ -303,26 +437,41 @@ def generate_report(state: GraphState) -> GraphState:
 
     try:
         resp = client.chat.completions.create(model=deployment, messages=messages)
+        if resp.usage is not None:
+            record("prompt_tokens", resp.usage.prompt_tokens)
+            record("completion_tokens", resp.usage.completion_tokens)
         state["impact_report"] = resp.choices[0].message.content
-        print("Successfully generated impact report.")
+        logger.info("Successfully generated impact report.")
     except Exception as e:
-        print(f"Error generating report: {e}")
+        logger.error("Error generating report: %s", e)
         state["error"] = f"Failed to generate report: {e}"
     return state
 
 def route_by_language(state: GraphState) -> Literal["chunk_and_embed_java", "chunk_and_embed_python"]:
     """Routes to the appropriate chunking node based on the detected language."""
-    if state["language"] == "java":
+    # Also taken after a failed load, so the chunking node ends a claimed index build.
+    if state.get("language") == "java":
         return "chunk_and_embed_java"
     else:
         return "chunk_and_embed_python"
 
+def route_after_lookup(state: GraphState) -> Literal["load_repository", "find_usages_java", "find_usages_python"]:
+    """Skips loading and embedding when `lookup_index` found a cached index."""
+    if state.get("error") or not state.get("index"):
+        return "load_repository"
+    if state["language"] == "java":
+        return "find_usages_java"
+    return "find_usages_python"
+
 # --- Graph Workflow Definition ---
 def create_workflow():
     """Creates and configures the LangGraph workflow."""
+    from langgraph.graph import StateGraph, END
+
     workflow = StateGraph(GraphState)
 
     workflow.add_node("get_pr_details", get_pr_details)
+    workflow.add_node("lookup_index", lookup_index)
     workflow.add_node("load_repository", load_repository)
     workflow.add_node("determine_language", determine_language)
     workflow.add_node("chunk_and_embed_python", chunk_and_embed_python)
@@ -332,7 +481,17 @@ def create_workflow():
     workflow.add_node("generate_report", generate_report)
 
     workflow.set_entry_point("get_pr_details")
-    workflow.add_edge("get_pr_details", "load_repository")
+    workflow.add_edge("get_pr_details", "lookup_index")
+
+    workflow.add_conditional_edges(
+        "lookup_index",
+        route_after_lookup,
+        {
+            "load_repository": "load_repository",
+            "find_usages_java": "find_usages_java",
+            "find_usages_python": "find_usages_python",
+        },
+    )
     workflow.add_edge("load_repository", "determine_language")
 
     workflow.add_conditional_edges(
@@ -352,3 +511,39 @@ def create_workflow():
     workflow.add_edge("generate_report", END)
 
     return workflow.compile()
+
+def create_index_workflow():
+    """
+    Creates the workflow that only builds and caches the index of a commit
+    (load, chunk and embed), used to pre-warm indexes on pushes.
+    """
+    from langgraph.graph import StateGraph, END
+
+    workflow = StateGraph(GraphState)
+
+    workflow.add_node("load_repository", load_repository)
+    workflow.add_node("determine_language", determine_language)
+    workflow.add_node("chunk_and_embed_python", chunk_and_embed_python)
+    workflow.add_node("chunk_and_embed_java", chunk_and_embed_java)
+
+    workflow.set_entry_point("load_repository")
+    workflow.add_edge("load_repository", "determine_language")
+
+    workflow.add_conditional_edges(
+        "determine_language",
+        route_by_language,
+        {
+            "chunk_and_embed_java": "chunk_and_embed_java",
+            "chunk_and_embed_python": "chunk_and_embed_python",
+        },
+    )
+
+    workflow.add_edge("chunk_and_embed_python", END)
+    workflow.add_edge("chunk_and_embed_java", END)
+
+    return workflow.compile()
+
+@functools.lru_cache(maxsize=1)
+def get_index_workflow():
+    """Returns the compiled index workflow, compiling it on first use."""
+    return create_index_workflow()
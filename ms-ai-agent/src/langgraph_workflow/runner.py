@@ -0,0 +1,85 @@
+"""
+Runs workflows on a dedicated, bounded thread pool.
+
+LangGraph's invoke is synchronous and a PR analysis takes seconds to
+minutes, so workflows get their own WORKFLOW_WORKERS threads (default 4).
+The event loop's default executor stays free for the short blocking calls
+around them (token lookup, addressees, outbox enqueue). Runs waiting for a
+thread and runs in progress are counted, and published as metrics.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from src.telemetry.metrics import WORKFLOWS_IN_PROGRESS, WORKFLOWS_QUEUED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+
+T = TypeVar("T")
+
+
+class WorkflowRunner:
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="workflow")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Runs `fn(*args)` on a workflow thread and awaits its result."""
+        state = {"started": False, "abandoned": False}
+        with self._lock:
+            self._queued += 1
+        WORKFLOWS_QUEUED.inc()
+
+        def call():
+            with self._lock:
+                if state["abandoned"]:
+                    raise asyncio.CancelledError()
+                state["started"] = True
+                self._queued -= 1
+                self._running += 1
+            WORKFLOWS_QUEUED.dec()
+            WORKFLOWS_IN_PROGRESS.inc()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                WORKFLOWS_IN_PROGRESS.dec()
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        finally:
+            with self._lock:
+                # The caller gave up before a thread picked the run up.
+                if not state["started"]:
+                    state["abandoned"] = True
+                    self._queued -= 1
+                    WORKFLOWS_QUEUED.dec()
+
+    def queued(self) -> int:
+        """Runs waiting for a workflow thread."""
+        with self._lock:
+            return self._queued
+
+    def running(self) -> int:
+        """Runs currently executing."""
+        with self._lock:
+            return self._running
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+@functools.lru_cache(maxsize=1)
+def get_workflow_runner() -> WorkflowRunner:
+    """Returns the process-wide runner, sized by WORKFLOW_WORKERS."""
+    return WorkflowRunner(int(os.environ.get("WORKFLOW_WORKERS", DEFAULT_WORKERS)))
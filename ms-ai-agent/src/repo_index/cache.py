@@ -0,0 +1,208 @@
+"""
+On-disk cache of repository indexes, keyed by repository and commit SHA.
+
+An index is what the load/chunk/embed nodes build for one commit (see
+src.repo_index.index_file). Indexes are written under INDEX_DIR, one file per
+commit and embedding configuration, and opened with `mmap`, so worker processes sharing the directory
+share both the builds and the memory of an index. PR analyses look up the
+index of their base commit and skip those nodes on a hit. An index built with
+a different embedding backend or model (see
+src.embedding.backends.get_embedding_id) is never returned.
+
+Builds in progress in this process are tracked as well: a build is claimed
+with `begin_build` (by the pre-warmer, or by the first analysis that misses
+the index), and an analysis arriving while the same commit is being indexed
+waits for that build instead of starting a second one.
+"""
+import asyncio
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, Sequence
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from src.repo_index.index_file import RepositoryIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join("data", "indexes")
+# Indexes kept open per process.
+DEFAULT_CACHE_SIZE = 8
+# Index files kept on disk per repository; older commits are removed.
+DEFAULT_KEEP_PER_REPOSITORY = 3
+
+_SUFFIX = ".idx"
+
+
+def _key(repo_full_name: str, sha: str) -> tuple[str, str]:
+    return repo_full_name.lower(), sha
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class IndexCache:
+    """
+    Index files under `index_dir`, with the most recently used ones kept
+    open. Evicted indexes are simply dropped: a mapping is released once the
+    last analysis using it finishes.
+    """
+
+    def __init__(self, index_dir: str, embedding_id: str, max_open: int = DEFAULT_CACHE_SIZE,
+                 keep_per_repository: int = DEFAULT_KEEP_PER_REPOSITORY):
+        self.index_dir = index_dir
+        self.embedding_id = embedding_id
+        self.max_open = max_open
+        self.keep_per_repository = keep_per_repository
+        self._lock = threading.Lock()
+        self._open: OrderedDict[tuple[str, str], "RepositoryIndex"] = OrderedDict()
+        self._building: dict[tuple[str, str], threading.Event] = {}
+
+    def _repository_dir(self, repo_full_name: str) -> str:
+        return os.path.join(self.index_dir, re.sub(r"[^\w.-]", "__", repo_full_name.lower()))
+
+    def path_for(self, repo_full_name: str, sha: str) -> str:
+        # Indexes of other embedding configurations live next to this one's.
+        embedding = hashlib.sha256(self.embedding_id.encode()).hexdigest()[:12]
+        return os.path.join(self._repository_dir(repo_full_name), f"{sha}.{embedding}{_SUFFIX}")
+
+    def get(self, repo_full_name: str, sha: str, wait: float = 0.0) -> Optional["RepositoryIndex"]:
+        """
+        Returns the index of a commit, or None. When the commit is being
+        indexed, waits up to `wait` seconds for the build to finish; the wait
+        is skipped when called from an event loop thread, which must not block.
+        """
+        key = _key(repo_full_name, sha)
+        with self._lock:
+            building = self._building.get(key)
+        if building is not None and wait > 0 and _on_event_loop():
+            logger.warning("Not waiting for the index of %s@%s on the event loop thread", repo_full_name, sha[:12])
+        elif building is not None and wait > 0:
+            logger.info("Waiting for the index of %s@%s to finish building", repo_full_name, sha[:12])
+            building.wait(wait)
+
+        with self._lock:
+            index = self._open.get(key)
+            if index is not None:
+                self._open.move_to_end(key)
+                return index
+
+        from src.repo_index.index_file import IndexFormatError, RepositoryIndex
+
+        path = self.path_for(repo_full_name, sha)
+        try:
+            index = RepositoryIndex(path)
+        except FileNotFoundError:
+            return None
+        except (IndexFormatError, OSError) as e:
+            logger.warning("Ignoring unreadable index %s: %s", path, e)
+            return None
+        if index.embedding_id != self.embedding_id:
+            logger.warning("Ignoring index %s built with %s, expected %s",
+                           path, index.embedding_id, self.embedding_id)
+            return None
+        self._remember(key, index)
+        return index
+
+    def contains(self, repo_full_name: str, sha: str) -> bool:
+        with self._lock:
+            if _key(repo_full_name, sha) in self._open:
+                return True
+        return os.path.exists(self.path_for(repo_full_name, sha))
+
+    def store(self, repo_full_name: str, sha: Optional[str], language: str, docs: Sequence["Document"],
+              chunks: Sequence["Document"], vectors) -> "RepositoryIndex":
+        """
+        Writes the index of a commit and returns it opened. Without a SHA the
+        index is written to an anonymous file that only the caller sees.
+        """
+        from src.repo_index.index_file import RepositoryIndex, write_index
+
+        if not sha:
+            os.makedirs(self.index_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=self.index_dir, suffix=_SUFFIX)
+            os.close(fd)
+            try:
+                write_index(path, language, self.embedding_id, docs, chunks, vectors)
+                return RepositoryIndex(path)
+            finally:
+                # The mapping stays valid after the file is unlinked.
+                os.unlink(path)
+
+        path = self.path_for(repo_full_name, sha)
+        write_index(path, language, self.embedding_id, docs, chunks, vectors)
+        index = RepositoryIndex(path)
+        self._remember(_key(repo_full_name, sha), index)
+        self._prune(repo_full_name)
+        return index
+
+    def _remember(self, key: tuple[str, str], index: "RepositoryIndex") -> None:
+        if self.max_open <= 0:
+            return
+        with self._lock:
+            self._open[key] = index
+            self._open.move_to_end(key)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+
+    def _prune(self, repo_full_name: str) -> None:
+        """Removes all but the newest `keep_per_repository` index files of a repository."""
+        directory = self._repository_dir(repo_full_name)
+        try:
+            paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(_SUFFIX)]
+            paths.sort(key=os.path.getmtime, reverse=True)
+        except OSError:
+            return
+        for path in paths[max(self.keep_per_repository, 1):]:
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+                logger.info("Removed old index %s", path)
+
+    def begin_build(self, repo_full_name: str, sha: str) -> bool:
+        """
+        Marks a commit as being indexed. Returns False, without marking it,
+        when another build of the commit is already in progress; otherwise the
+        caller must call `end_build` once its build has finished or failed.
+        """
+        key = _key(repo_full_name, sha)
+        with self._lock:
+            if key in self._building:
+                return False
+            self._building[key] = threading.Event()
+            return True
+
+    def end_build(self, repo_full_name: str, sha: str) -> None:
+        """Ends a build claimed with `begin_build` and wakes those waiting for it."""
+        with self._lock:
+            event = self._building.pop(_key(repo_full_name, sha), None)
+        if event is not None:
+            event.set()
+
+
+@functools.lru_cache(maxsize=1)
+def get_index_cache() -> IndexCache:
+    """
+    Returns the process-wide cache, configured by INDEX_DIR, INDEX_CACHE_SIZE
+    (indexes kept open) and INDEX_KEEP_PER_REPOSITORY (files kept on disk),
+    for the embedding backend configured by EMBEDDING_BACKEND.
+    """
+    from src.embedding.backends import get_embedding_id
+
+    return IndexCache(
+        os.environ.get("INDEX_DIR", DEFAULT_INDEX_DIR),
+        get_embedding_id(),
+        max_open=int(os.environ.get("INDEX_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+        keep_per_repository=int(os.environ.get("INDEX_KEEP_PER_REPOSITORY", DEFAULT_KEEP_PER_REPOSITORY)),
+    )
@@ -0,0 +1,182 @@
+"""
+Read-only, memory-mapped repository index file.
+
+One file holds everything the usage search needs for a commit:
+
+    header       magic, version, language, embedding id, dimensions and
+                 section offsets
+    vectors      float32 [chunks, dimensions], L2-normalised
+    chunk table  uint64 [chunks, 4]: text offset/length, metadata offset/length
+    doc table    uint64 [docs, 4]:   content offset/length, metadata offset/length
+    blob         UTF-8 chunk texts, file contents and JSON metadata
+
+Sections start on 64-byte boundaries. Files are written once to a temporary
+name and renamed into place, and are opened with `mmap`, so every worker
+process reading the same index shares its pages through the OS page cache
+and nothing is copied when it is opened.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+MAGIC = b"PRIDX\x00\x00\x01"
+VERSION = 2
+_EMBEDDING_ID_SIZE = 256
+_HEADER = struct.Struct(f"<8sI16s{_EMBEDDING_ID_SIZE}sIQQQQQQ")
+_ALIGNMENT = 64
+
+
+class IndexFormatError(ValueError):
+    """The file is not a readable index."""
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+class _Blob:
+    def __init__(self):
+        self.parts: list[bytes] = []
+        self.size = 0
+
+    def add(self, data: bytes) -> tuple[int, int]:
+        offset = self.size
+        self.parts.append(data)
+        self.size += len(data)
+        return offset, len(data)
+
+    def add_metadata(self, metadata: dict) -> tuple[int, int]:
+        return self.add(json.dumps(metadata, ensure_ascii=False, default=str).encode())
+
+
+def write_index(path: str, language: str, embedding_id: str, docs: Sequence[Document],
+                chunks: Sequence[Document], vectors) -> None:
+    """
+    Writes an index file atomically. `vectors` holds one embedding per chunk,
+    made by the backend and model `embedding_id` names.
+    """
+    encoded_id = embedding_id.encode()
+    if len(encoded_id) > _EMBEDDING_ID_SIZE:
+        raise ValueError(f"embedding id is too long: {embedding_id!r}")
+    if chunks:
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), -1)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms > 0, norms, 1)
+
+    blob = _Blob()
+    chunk_table = np.array(
+        [(*blob.add(c.page_content.encode()), *blob.add_metadata(c.metadata)) for c in chunks],
+        dtype=np.uint64,
+    ).reshape(len(chunks), 4)
+    doc_table = np.array(
+        [(*blob.add(d.page_content.encode()), *blob.add_metadata(d.metadata)) for d in docs],
+        dtype=np.uint64,
+    ).reshape(len(docs), 4)
+
+    vectors_offset = _align(_HEADER.size)
+    chunks_offset = _align(vectors_offset + matrix.nbytes)
+    docs_offset = _align(chunks_offset + chunk_table.nbytes)
+    blob_offset = _align(docs_offset + doc_table.nbytes)
+    header = _HEADER.pack(MAGIC, VERSION, language.encode(), encoded_id, matrix.shape[1], len(chunks), len(docs),
+                          vectors_offset, chunks_offset, docs_offset, blob_offset)
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for offset, data in ((0, header), (vectors_offset, matrix.tobytes()),
+                                 (chunks_offset, chunk_table.tobytes()), (docs_offset, doc_table.tobytes())):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(data)
+            f.write(b"\0" * (blob_offset - f.tell()))
+            f.writelines(blob.parts)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class RepositoryIndex:
+    """
+    A memory-mapped index file. The vectors and tables are NumPy views of the
+    mapping and chunk texts are decoded on access, so opening an index costs
+    no copies regardless of its size.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise IndexFormatError(f"{path}: file is too short")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, language, embedding_id, dimensions, n_chunks, n_docs,
+         vectors_offset, chunks_offset, docs_offset, self._blob_offset) = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise IndexFormatError(f"{path}: not a version {VERSION} index file")
+
+        self.language = language.rstrip(b"\0").decode()
+        self.embedding_id = embedding_id.rstrip(b"\0").decode()
+        self.dimensions = dimensions
+        self.vectors = np.frombuffer(self._map, np.float32, n_chunks * dimensions,
+                                     vectors_offset).reshape(n_chunks, dimensions)
+        self._chunks = np.frombuffer(self._map, np.uint64, n_chunks * 4, chunks_offset).reshape(n_chunks, 4)
+        self._docs = np.frombuffer(self._map, np.uint64, n_docs * 4, docs_offset).reshape(n_docs, 4)
+        self._doc_paths: Optional[dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def _text(self, offset, length) -> str:
+        start = self._blob_offset + int(offset)
+        return self._map[start:start + int(length)].decode()
+
+    def _metadata(self, offset, length) -> dict:
+        return json.loads(self._text(offset, length))
+
+    # --- Chunks ---
+    def chunk(self, i: int) -> Document:
+        text_offset, text_length, meta_offset, meta_length = self._chunks[i]
+        return Document(page_content=self._text(text_offset, text_length),
+                        metadata=self._metadata(meta_offset, meta_length))
+
+    def similarity_search_by_vector(self, query, k: int = 4) -> list[Document]:
+        """Returns the `k` chunks closest to `query` by cosine similarity."""
+        if not len(self) or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        if query.shape != (self.dimensions,):
+            raise ValueError(f"query has {query.size} dimensions, the index {self.dimensions} "
+                             f"(built with {self.embedding_id})")
+        scores = self.vectors @ (query / (np.linalg.norm(query) or 1))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.chunk(i) for i in top[np.argsort(-scores[top])]]
+
+    def similarity_search(self, query: str, embeddings, k: int = 4) -> list[Document]:
+        return self.similarity_search_by_vector(embeddings.embed_query(query), k)
+
+    # --- Source files ---
+    def document_metadata(self) -> Iterator[dict]:
+        for _, _, meta_offset, meta_length in self._docs:
+            yield self._metadata(meta_offset, meta_length)
+
+    def document_content(self, path: str) -> Optional[str]:
+        """Returns the content of the file at `path` in the indexed commit, or None."""
+        if self._doc_paths is None:
+            self._doc_paths = {meta.get("path"): i for i, meta in enumerate(self.document_metadata())}
+        i = self._doc_paths.get(path)
+        if i is None:
+            return None
+        content_offset, content_length, _, _ = self._docs[i]
+        return self._text(content_offset, content_length)
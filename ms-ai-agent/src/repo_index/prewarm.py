@@ -0,0 +1,141 @@
+"""
+Background pre-warming of repository indexes.
+
+`push` events to a repository's default branch schedule an index build for
+the pushed commit, so PRs opened against it later find the index of their
+base commit ready. Builds run one at a time on a low-priority thread: a build
+only starts while no PR analysis is running, and several pushes to the same
+repository before its build starts collapse into one build of the latest
+commit.
+"""
+import contextlib
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from src.repo_index.cache import get_index_cache
+from src.telemetry.spans import start_trace_span
+
+logger = logging.getLogger(__name__)
+
+# How often an idle worker re-checks for foreground work, in seconds.
+IDLE_POLL_INTERVAL = 1.0
+
+
+@dataclass
+class _IndexJob:
+    repo_full_name: str
+    sha: str
+    github_token: str
+    scheduled_at: float
+
+
+class IndexPrewarmer:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: OrderedDict[str, _IndexJob] = OrderedDict()
+        self._foreground = 0
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Producer side ---
+    def schedule(self, repo_full_name: str, sha: str, github_token: str) -> bool:
+        """
+        Schedules an index build for a commit. Replaces a build of the same
+        repository that has not started yet. Returns False if the commit is
+        already indexed.
+        """
+        if get_index_cache().contains(repo_full_name, sha):
+            return False
+        with self._cond:
+            key = repo_full_name.lower()
+            self._pending.pop(key, None)
+            self._pending[key] = _IndexJob(repo_full_name, sha, github_token, time.time())
+            self._cond.notify_all()
+        logger.info("Scheduled index build for %s@%s", repo_full_name, sha[:12])
+        return True
+
+    @contextlib.contextmanager
+    def foreground(self) -> Iterator[None]:
+        """Holds back index builds while a PR analysis runs."""
+        with self._cond:
+            self._foreground += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._foreground -= 1
+                self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    # --- Worker ---
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="index-prewarm", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_job(self) -> Optional[_IndexJob]:
+        with self._cond:
+            while not self._stopping and (not self._pending or self._foreground):
+                self._cond.wait(IDLE_POLL_INTERVAL)
+            if self._stopping:
+                return None
+            _, job = self._pending.popitem(last=False)
+            return job
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self.build(job.repo_full_name, job.sha, job.github_token)
+            except Exception:
+                logger.exception("Index build for %s@%s failed", job.repo_full_name, job.sha[:12])
+
+    def build(self, repo_full_name: str, sha: str, github_token: str) -> bool:
+        """Builds and caches the index of a commit. Returns True on success."""
+        from src.langgraph_workflow.graph import get_index_workflow
+
+        cache = get_index_cache()
+        if cache.contains(repo_full_name, sha):
+            return True
+        if not cache.begin_build(repo_full_name, sha):
+            logger.info("Index of %s@%s is already being built", repo_full_name, sha[:12])
+            return True
+        start = time.perf_counter()
+        try:
+            with start_trace_span("index_build", repo=repo_full_name, sha=sha):
+                final_state = get_index_workflow().invoke({
+                    "repo_full_name": repo_full_name,
+                    "base_sha": sha,
+                    "github_token": github_token,
+                })
+        finally:
+            cache.end_build(repo_full_name, sha)
+        if final_state.get("error"):
+            logger.warning("Index build for %s@%s failed: %s", repo_full_name, sha[:12], final_state["error"])
+            return False
+        logger.info("Built index for %s@%s in %.2fs", repo_full_name, sha[:12], time.perf_counter() - start)
+        return True
+
+
+@functools.lru_cache(maxsize=1)
+def get_prewarmer() -> IndexPrewarmer:
+    """Returns the process-wide pre-warmer."""
+    return IndexPrewarmer()
@@ -0,0 +1,58 @@
+"""
+Per-repository report addressees, managed from the frontend
+(addAddressee / deleteAddressee) and used to resolve report recipients.
+"""
+import functools
+import os
+
+from src.report_delivery import store
+
+# Used when a repository has no addressees registered.
+DEFAULT_FALLBACK_RECIPIENTS = "bjm222@naver.com"
+
+
+class AddresseeStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        store.initialize(db_path)
+
+    def add(self, repository_id: int, name: str, email: str) -> None:
+        with store.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO addressees (repository_id, name, email) VALUES (?, ?, ?) "
+                "ON CONFLICT (repository_id, email) DO UPDATE SET name = excluded.name",
+                (repository_id, name, email.strip().lower()),
+            )
+
+    def remove(self, repository_id: int, email: str) -> bool:
+        with store.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "DELETE FROM addressees WHERE repository_id = ? AND email = ?",
+                (repository_id, email.strip().lower()),
+            )
+            return cursor.rowcount > 0
+
+    def for_repository(self, repository_id: int) -> list[dict]:
+        with store.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT name, email FROM addressees WHERE repository_id = ? ORDER BY email",
+                (repository_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def recipients_for(self, repository_id) -> list[str]:
+        """
+        Emails registered for a repository, or REPORT_FALLBACK_RECIPIENTS
+        (comma-separated) when there are none.
+        """
+        emails = [a["email"] for a in self.for_repository(repository_id)] if repository_id is not None else []
+        if emails:
+            return emails
+        fallback = os.environ.get("REPORT_FALLBACK_RECIPIENTS", DEFAULT_FALLBACK_RECIPIENTS)
+        return [email.strip() for email in fallback.split(",") if email.strip()]
+
+
+@functools.lru_cache(maxsize=1)
+def get_addressee_store() -> AddresseeStore:
+    """Returns the process-wide store, opened on first use."""
+    return AddresseeStore(store.get_db_path())
@@ -0,0 +1,357 @@
+"""
+Durable outbox for report delivery.
+
+Reports are written to a local SQLite table and posted to REPORT_TARGET_URL
+by a background thread using one pooled HTTP client, so delivery never
+blocks the analysis. Failed deliveries are retried with exponential backoff
+and every POST carries an Idempotency-Key header, stable across retries.
+
+The target receives one POST per recipient with a single address in "to",
+{"to": "a@example.com", "subject": ..., "body": ...}, as it did before the
+outbox; each recipient is delivered and retried independently.
+
+With REPORT_DIGEST_INTERVAL set (seconds), reports for the same repository
+and recipient are held for that long and sent together as one digest. The
+rows of a digest are tied together by its key when it is first claimed, so a
+retry resends the same reports under the same key; reports arriving later go
+into the next digest.
+
+Rows are claimed with a lease and a claim token (worker id and lease expiry).
+The lease is renewed before each delivery and rows are only marked by the
+worker still holding them, so several worker processes can share the outbox
+without sending a report twice. Sent and dead rows are purged after
+REPORT_OUTBOX_RETENTION seconds (default 7 days).
+"""
+import functools
+import hashlib
+import html
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from src.report_delivery import store
+from src.telemetry.metrics import REPORT_OUTBOX_PENDING, REPORTS_SENT
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 600.0
+CLAIM_LEASE = 120.0
+POLL_INTERVAL = 1.0
+CLAIM_LIMIT = 200
+DEFAULT_RETENTION = 7 * 24 * 3600.0
+PURGE_INTERVAL = 3600.0
+
+
+@dataclass
+class _Delivery:
+    ids: list[int]
+    attempts: int
+    idempotency_key: str
+    to: str
+    subject: str
+    body: str
+    claim_token: str
+
+
+class _PermanentFailure(Exception):
+    """The target rejected the report; retrying will not help."""
+
+
+class ReportOutbox:
+    def __init__(self, db_path: str, target_url: Optional[str], digest_interval: float = 0.0,
+                 timeout: float = 15.0, retention: float = DEFAULT_RETENTION):
+        self.db_path = db_path
+        self.target_url = target_url
+        self.digest_interval = digest_interval
+        self.timeout = timeout
+        self.retention = retention
+        self._last_purge = 0.0
+        self._worker_id = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        store.initialize(db_path)
+
+    # --- Producer side ---
+    def enqueue(self, repo_full_name: str, recipients: list[str], subject: str, body: str,
+                dedup_key: str) -> bool:
+        """
+        Stores a report for delivery to each recipient. `dedup_key` identifies
+        the report (e.g. repository, PR and head commit); enqueueing it again
+        for a recipient is a no-op. Returns False when nothing was stored.
+        """
+        if not self.target_url:
+            logger.warning("--- REPORT_TARGET_URL not set. Skipping report delivery. ---")
+            REPORTS_SENT.labels(outcome="skipped").inc()
+            return False
+
+        now = time.time()
+        rows = [
+            (hashlib.sha256(f"{dedup_key}|{to}".encode()).hexdigest(), repo_full_name, to, subject, body, now, now)
+            for to in sorted(set(recipients))
+        ]
+        with store.connect(self.db_path) as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, repo_full_name, recipient, subject, body, "
+                "next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            stored = conn.total_changes - before
+        if stored:
+            self._wake.set()
+        return stored > 0
+
+    # --- Delivery worker ---
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="report-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        import httpx
+
+        with httpx.Client(timeout=self.timeout, limits=httpx.Limits(max_keepalive_connections=4)) as client:
+            while not self._stop.is_set():
+                try:
+                    deliveries = self._claim_due()
+                except Exception:
+                    logger.exception("Could not read the report outbox")
+                    deliveries = []
+                for delivery in deliveries:
+                    if self._stop.is_set():
+                        break
+                    try:
+                        renewed = self._renew(delivery)
+                    except Exception:
+                        logger.exception("Could not renew the claim on report(s) %s", delivery.ids)
+                        renewed = False
+                    if renewed:
+                        self._deliver(client, delivery)
+                try:
+                    REPORT_OUTBOX_PENDING.set(self.pending())
+                    if time.time() - self._last_purge >= PURGE_INTERVAL:
+                        self.purge()
+                except Exception:
+                    logger.exception("Could not read the report outbox")
+                if not deliveries:
+                    self._wake.wait(POLL_INTERVAL)
+                    self._wake.clear()
+
+    def _claim_token(self) -> tuple[str, float]:
+        lease_expiry = time.time() + CLAIM_LEASE
+        return f"{self._worker_id}:{lease_expiry:.6f}", lease_expiry
+
+    def _claim_due(self) -> list[_Delivery]:
+        """Claims due rows with a lease and groups them into deliveries."""
+        now = time.time()
+        token, lease_expiry = self._claim_token()
+        with store.connect(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                    "ORDER BY id LIMIT ?", (now, CLAIM_LIMIT),
+                ).fetchall()
+                if self.digest_interval > 0:
+                    groups = self._digest_groups(conn, rows, now)
+                    conn.executemany("UPDATE outbox SET batch_key = ? WHERE id = ? AND batch_key IS NULL",
+                                     [(key, row["id"]) for key, group in groups.items() for row in group])
+                else:
+                    groups = {row["idempotency_key"]: [row] for row in rows}
+                conn.executemany("UPDATE outbox SET next_attempt_at = ?, claim_token = ? WHERE id = ?",
+                                 [(lease_expiry, token, row["id"]) for group in groups.values() for row in group])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [self._digest(key, group, token) for key, group in groups.items()]
+
+    def _digest_groups(self, conn, rows: list, now: float) -> dict[str, list]:
+        """
+        Groups due rows into digests keyed by their idempotency key. Rows of a
+        digest claimed before keep its key and are completed with the rest of
+        it; the others are grouped by repository and recipient once their
+        oldest report has waited for the digest interval.
+        """
+        batches: dict[str, list] = {}
+        fresh: dict[tuple[str, str], list] = {}
+        for row in rows:
+            if row["batch_key"]:
+                batches.setdefault(row["batch_key"], [])
+            else:
+                fresh.setdefault((row["repo_full_name"], row["recipient"]), []).append(row)
+        if batches:
+            marks = ", ".join("?" * len(batches))
+            for row in conn.execute(
+                f"SELECT * FROM outbox WHERE status = 'pending' AND batch_key IN ({marks}) ORDER BY id",
+                list(batches),
+            ):
+                batches[row["batch_key"]].append(row)
+        for group in fresh.values():
+            if min(r["created_at"] for r in group) <= now - self.digest_interval:
+                key = hashlib.sha256("|".join(sorted(r["idempotency_key"] for r in group)).encode()).hexdigest()
+                batches[key] = group
+        return batches
+
+    @staticmethod
+    def _single(row, claim_token: str) -> _Delivery:
+        return _Delivery([row["id"]], row["attempts"], row["idempotency_key"],
+                         row["recipient"], row["subject"], row["body"], claim_token)
+
+    @staticmethod
+    def _digest(key: str, rows: list, claim_token: str) -> _Delivery:
+        # A lone report is sent as is, under its own key.
+        if len(rows) == 1:
+            return ReportOutbox._single(rows[0], claim_token)
+        repo = rows[0]["repo_full_name"]
+        body = "<hr/>".join(
+            f"<h2>{html.escape(r['subject'])}</h2>\n{r['body']}" for r in rows
+        )
+        return _Delivery([r["id"] for r in rows], max(r["attempts"] for r in rows), key,
+                         rows[0]["recipient"], f"[{repo}] {len(rows)} PR impact reports", body, claim_token)
+
+    def _renew(self, delivery: _Delivery) -> bool:
+        """
+        Extends the lease on a delivery's rows before it is sent. Returns False,
+        and leaves the rows alone, when another worker has claimed any of them
+        since (this worker's lease ran out).
+        """
+        token, lease_expiry = self._claim_token()
+        marks = ", ".join("?" * len(delivery.ids))
+        with store.connect(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                held = conn.execute(
+                    f"SELECT COUNT(*) FROM outbox WHERE id IN ({marks}) AND status = 'pending' AND claim_token = ?",
+                    (*delivery.ids, delivery.claim_token),
+                ).fetchone()[0]
+                if held == len(delivery.ids):
+                    conn.execute(
+                        f"UPDATE outbox SET next_attempt_at = ?, claim_token = ? WHERE id IN ({marks})",
+                        (lease_expiry, token, *delivery.ids),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if held != len(delivery.ids):
+            logger.warning("Lost the claim on report(s) %s; leaving them to the worker holding them", delivery.ids)
+            return False
+        delivery.claim_token = token
+        return True
+
+    def _deliver(self, client, delivery: _Delivery) -> None:
+        try:
+            response = client.post(
+                self.target_url,
+                json={"to": delivery.to, "subject": delivery.subject, "body": delivery.body},
+                headers={"Content-Type": "application/json", "Idempotency-Key": delivery.idempotency_key},
+            )
+            if response.status_code >= 400:
+                retryable = response.status_code in (408, 425, 429) or response.status_code >= 500
+                message = f"HTTP {response.status_code}: {response.text[:200]}"
+                if not retryable:
+                    raise _PermanentFailure(message)
+                raise RuntimeError(message)
+        except _PermanentFailure as e:
+            self._mark_failed(delivery, str(e), permanent=True)
+        except Exception as e:
+            self._mark_failed(delivery, str(e), permanent=False)
+        else:
+            self._mark_sent(delivery)
+
+    def _mark_sent(self, delivery: _Delivery) -> None:
+        now = time.time()
+        with store.connect(self.db_path) as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, claim_token = NULL "
+                "WHERE id = ? AND claim_token = ?",
+                [(now, i, delivery.claim_token) for i in delivery.ids],
+            )
+            marked = self._check_marked(delivery, conn.total_changes - before)
+        if not marked:
+            return
+        REPORTS_SENT.labels(outcome="sent").inc(marked)
+        logger.info("Delivered report(s) %s to %s", delivery.ids, delivery.to)
+
+    def _mark_failed(self, delivery: _Delivery, error: str, permanent: bool) -> None:
+        attempts = delivery.attempts + 1
+        dead = permanent or attempts >= MAX_ATTEMPTS
+        backoff = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        # The rows of a digest fall due together, so it is retried as a whole.
+        next_attempt_at = time.time() + backoff
+        with store.connect(self.db_path) as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ?, "
+                "claim_token = NULL WHERE id = ? AND claim_token = ?",
+                [("dead" if dead else "pending", next_attempt_at, error, i, delivery.claim_token)
+                 for i in delivery.ids],
+            )
+            marked = self._check_marked(delivery, conn.total_changes - before)
+        if not marked:
+            return
+        if dead:
+            REPORTS_SENT.labels(outcome="dead").inc(marked)
+            logger.error("Giving up on report(s) %s after %d attempt(s): %s", delivery.ids, attempts, error)
+        else:
+            REPORTS_SENT.labels(outcome="retry").inc(marked)
+            logger.warning("Report delivery failed (attempt %d), retrying in %.0fs: %s", attempts, backoff, error)
+
+    @staticmethod
+    def _check_marked(delivery: _Delivery, marked: int) -> int:
+        """Returns how many rows were marked, warning about those another worker took over."""
+        if marked < len(delivery.ids):
+            logger.warning("Claim on report(s) %s expired during delivery; %d of them were taken over",
+                           delivery.ids, len(delivery.ids) - marked)
+        return marked
+
+    # --- Maintenance ---
+    def purge(self) -> int:
+        """Deletes sent and dead rows older than the retention period."""
+        self._last_purge = time.time()
+        with store.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "DELETE FROM outbox WHERE status IN ('sent', 'dead') AND created_at < ?",
+                (self._last_purge - self.retention,),
+            )
+        if cursor.rowcount:
+            logger.info("Purged %d delivered or abandoned report(s) from the outbox", cursor.rowcount)
+        return cursor.rowcount
+
+    # --- Introspection ---
+    def pending(self) -> int:
+        with store.connect(self.db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def stats(self) -> dict:
+        with store.connect(self.db_path) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+@functools.lru_cache(maxsize=1)
+def get_outbox() -> ReportOutbox:
+    """Returns the process-wide outbox configured from the environment."""
+    return ReportOutbox(
+        db_path=store.get_db_path(),
+        target_url=os.environ.get("REPORT_TARGET_URL"),
+        digest_interval=float(os.environ.get("REPORT_DIGEST_INTERVAL", "0")),
+        retention=float(os.environ.get("REPORT_OUTBOX_RETENTION", DEFAULT_RETENTION)),
+    )
@@ -0,0 +1,68 @@
+"""
+Local SQLite database shared by the report outbox and the addressee lists.
+"""
+import contextlib
+import os
+import sqlite3
+from typing import Iterator
+
+DEFAULT_DB_PATH = os.path.join("data", "report_delivery.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    repo_full_name TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    claim_token TEXT,
+    batch_key TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_batch ON outbox (batch_key);
+CREATE INDEX IF NOT EXISTS outbox_created ON outbox (status, created_at);
+
+CREATE TABLE IF NOT EXISTS addressees (
+    repository_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    PRIMARY KEY (repository_id, email)
+);
+"""
+
+
+def get_db_path() -> str:
+    """Location of the database, overridable with REPORT_DELIVERY_DB."""
+    return os.environ.get("REPORT_DELIVERY_DB", DEFAULT_DB_PATH)
+
+
+@contextlib.contextmanager
+def connect(path: str) -> Iterator[sqlite3.Connection]:
+    """
+    Opens an autocommit connection for the duration of the block. Connections
+    are short-lived, so the database can be used from any thread and by
+    several worker processes.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        yield conn
+    finally:
+        conn.close()
+
+
+def initialize(path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
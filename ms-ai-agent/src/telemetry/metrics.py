@@ -0,0 +1,80 @@
+"""
+Prometheus metrics for the webhook handlers and the workflow nodes.
+"""
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# --- Webhook handlers ---
+WEBHOOK_REQUESTS = Counter(
+    "pr_analyzer_webhook_requests_total",
+    "Webhook deliveries received, by GitHub event and outcome.",
+    ["event", "outcome"],
+)
+WEBHOOK_DURATION = Histogram(
+    "pr_analyzer_webhook_duration_seconds",
+    "Time spent handling a webhook delivery.",
+    ["event"],
+    buckets=_LATENCY_BUCKETS,
+)
+WORKFLOWS_IN_PROGRESS = Gauge(
+    "pr_analyzer_workflows_in_progress",
+    "Workflow runs currently executing.",
+)
+WORKFLOWS_QUEUED = Gauge(
+    "pr_analyzer_workflows_queued",
+    "Workflow runs waiting for a workflow thread.",
+)
+REPORTS_SENT = Counter(
+    "pr_analyzer_reports_sent_total",
+    "Report deliveries to REPORT_TARGET_URL, by outcome.",
+    ["outcome"],
+)
+REPORT_OUTBOX_PENDING = Gauge(
+    "pr_analyzer_report_outbox_pending",
+    "Reports waiting in the delivery outbox.",
+)
+
+# --- Workflow nodes ---
+NODE_DURATION = Histogram(
+    "pr_analyzer_node_duration_seconds",
+    "Time spent in a workflow node.",
+    ["node"],
+    buckets=_LATENCY_BUCKETS,
+)
+NODE_ERRORS = Counter(
+    "pr_analyzer_node_errors_total",
+    "Workflow node runs that raised or recorded an error.",
+    ["node"],
+)
+RETRIEVAL_DURATION = Histogram(
+    "pr_analyzer_retrieval_duration_seconds",
+    "Latency of a single vector store retrieval.",
+    ["node"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+# Counters fed from span attributes of the same name, see src.telemetry.spans.
+SPAN_COUNTERS = {
+    "github_requests": Counter(
+        "pr_analyzer_github_requests_total", "GitHub API requests made.", ["node"]),
+    "github_bytes": Counter(
+        "pr_analyzer_github_bytes_total", "Bytes received from the GitHub API.", ["node"]),
+    "files_parsed": Counter(
+        "pr_analyzer_files_parsed_total", "Source files parsed.", ["node"]),
+    "chunks_produced": Counter(
+        "pr_analyzer_chunks_produced_total", "Code chunks produced for embedding.", ["node"]),
+    "embedding_tokens": Counter(
+        "pr_analyzer_embedding_tokens_total", "Tokens sent to the embedding model.", ["node"]),
+    "retrievals": Counter(
+        "pr_analyzer_retrievals_total", "Vector store retrievals.", ["node"]),
+    "prompt_tokens": Counter(
+        "pr_analyzer_prompt_tokens_total", "Prompt tokens sent to the chat model.", ["node"]),
+    "completion_tokens": Counter(
+        "pr_analyzer_completion_tokens_total", "Completion tokens returned by the chat model.", ["node"]),
+}
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Returns the current metrics in the Prometheus text format and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
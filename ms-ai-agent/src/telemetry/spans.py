@@ -0,0 +1,154 @@
+"""
+Per-node spans for the LangGraph workflow.
+
+Every node is wrapped with `node_span`, which times the node, collects the
+counters recorded while it runs (GitHub calls and bytes, files parsed, chunks,
+embedding tokens, retrievals, prompt/completion tokens) and publishes them as
+Prometheus metrics, a structured log line and, when the OpenTelemetry SDK is
+installed and OTEL_EXPORTER_OTLP_ENDPOINT is set, an exported trace span.
+
+Code running inside a node reports through `record` and `timed` without
+having to pass the span around.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from src.telemetry.metrics import NODE_DURATION, NODE_ERRORS, RETRIEVAL_DURATION, SPAN_COUNTERS
+
+try:
+    from opentelemetry import trace
+except ImportError:  # OpenTelemetry is optional
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["NodeSpan"]] = contextvars.ContextVar("node_span", default=None)
+_listeners: list[Callable[["NodeSpan"], None]] = []
+
+_HISTOGRAMS = {"retrieval": RETRIEVAL_DURATION}
+
+
+class NodeSpan:
+    """Counters and timing collected while one workflow node runs."""
+
+    def __init__(self, node: str):
+        self.node = node
+        self.attributes: dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.duration: float = 0.0
+
+    def add(self, key: str, amount: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+def record(key: str, amount: float = 1) -> None:
+    """Adds `amount` to counter `key` of the node currently running, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.add(key, amount)
+
+
+@contextlib.contextmanager
+def timed(key: str):
+    """Times the enclosed block, counting it under `key` and `<key>_seconds`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        span = _current_span.get()
+        if span is not None:
+            span.add(f"{key}_seconds", elapsed)
+            histogram = _HISTOGRAMS.get(key)
+            if histogram is not None:
+                histogram.labels(node=span.node).observe(elapsed)
+
+
+def add_span_listener(listener: Callable[[NodeSpan], None]) -> None:
+    """Registers a callback invoked with every finished NodeSpan."""
+    _listeners.append(listener)
+
+
+def start_trace_span(name: str, **attributes):
+    """Starts an OpenTelemetry span, or does nothing when OpenTelemetry is not installed."""
+    if trace is None:
+        return contextlib.nullcontext()
+    return trace.get_tracer("pr-impact-analyzer").start_as_current_span(name, attributes=attributes)
+
+
+def node_span(name: str):
+    """Decorator that instruments a workflow node `fn(state) -> state`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(state):
+            span = NodeSpan(name)
+            token = _current_span.set(span)
+            error_before = state.get("error")
+            start = time.perf_counter()
+            try:
+                with start_trace_span(f"node.{name}") as otel_span:
+                    result = fn(state)
+                    if otel_span is not None:
+                        otel_span.set_attributes(span.attributes)
+                if result.get("error") and result.get("error") != error_before:
+                    span.error = result["error"]
+                return result
+            except Exception as e:
+                span.error = str(e)
+                raise
+            finally:
+                span.duration = time.perf_counter() - start
+                _current_span.reset(token)
+                _finish(span)
+        return wrapper
+    return decorator
+
+
+def _finish(span: NodeSpan) -> None:
+    NODE_DURATION.labels(node=span.node).observe(span.duration)
+    if span.error:
+        NODE_ERRORS.labels(node=span.node).inc()
+    for key, value in span.attributes.items():
+        counter = SPAN_COUNTERS.get(key)
+        if counter is not None and value:
+            counter.labels(node=span.node).inc(value)
+
+    details = " ".join(f"{key}={value:g}" for key, value in sorted(span.attributes.items()))
+    logger.info("node=%s duration=%.3fs %s%s", span.node, span.duration, details,
+                f" error={span.error!r}" if span.error else "")
+
+    for listener in _listeners:
+        try:
+            listener(span)
+        except Exception:
+            logger.exception("Span listener failed")
+
+
+def configure_tracing(service_name: str = "pr-impact-analyzer") -> bool:
+    """
+    Installs an OTLP exporting tracer provider when OTEL_EXPORTER_OTLP_ENDPOINT
+    is set and the OpenTelemetry SDK and OTLP exporter are installed.
+    Returns True when spans will be exported.
+    """
+    if not os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / "
+                       "opentelemetry-exporter-otlp are not installed; tracing disabled.")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    logger.info("Exporting OpenTelemetry traces to %s", os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"])
+    return True
@@ -0,0 +1,304 @@
+"""
+Structured model of a unified diff for a single file.
+
+A patch is parsed once into hunks; the same FileDiff then provides the added
+and deleted line numbers, applies the patch to the base content in one pass
+and yields the edit ranges tree-sitter needs to reparse the patched file
+incrementally.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import NamedTuple, Optional
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+NO_NEWLINE_MARKER = '\\'
+
+
+class PatchError(ValueError):
+    """Raised for malformed patches or when a patch does not match the source."""
+
+
+class InputEdit(NamedTuple):
+    """One edit in the form expected by tree_sitter.Tree.edit(**edit._asdict())."""
+    start_byte: int
+    old_end_byte: int
+    new_end_byte: int
+    start_point: tuple[int, int]
+    old_end_point: tuple[int, int]
+    new_end_point: tuple[int, int]
+
+
+@dataclass
+class Hunk:
+    """
+    A single hunk. Start lines are 1-based as in the header; `lines` holds
+    (op, text) pairs where op is ' ', '-' or '+' and text has no line ending.
+    """
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: list[tuple[str, str]] = field(default_factory=list)
+    old_missing_newline: bool = False
+    new_missing_newline: bool = False
+
+    @property
+    def old_span(self) -> range:
+        """0-based line numbers of the base file covered by this hunk."""
+        start = self.old_start - 1 if self.old_count else self.old_start
+        return range(start, start + self.old_count)
+
+    @property
+    def new_span(self) -> range:
+        """0-based line numbers of the patched file covered by this hunk."""
+        start = self.new_start - 1 if self.new_count else self.new_start
+        return range(start, start + self.new_count)
+
+
+@dataclass
+class PatchedFile:
+    """Result of FileDiff.apply: the patched text plus what is needed to derive edits."""
+    text: str
+    lines: list[str]
+    # (index of the first patched line, replaced text, inserted text) per change run
+    changes: list[tuple[int, str, str]]
+
+    def edits(self) -> list[InputEdit]:
+        """
+        Edit ranges in application order. Each edit is expressed in the
+        coordinates of the document with all previous edits applied, which is
+        what successive tree_sitter.Tree.edit calls expect.
+        """
+        edits = []
+        byte_offset = 0
+        line_index = 0
+        for new_index, old_text, new_text in self.changes:
+            byte_offset += sum(len(line.encode()) for line in self.lines[line_index:new_index])
+            line_index = new_index
+            start_point = (new_index, 0)
+            old_bytes = old_text.encode()
+            new_bytes = new_text.encode()
+            edits.append(InputEdit(
+                start_byte=byte_offset,
+                old_end_byte=byte_offset + len(old_bytes),
+                new_end_byte=byte_offset + len(new_bytes),
+                start_point=start_point,
+                old_end_point=_advance(start_point, old_bytes),
+                new_end_point=_advance(start_point, new_bytes),
+            ))
+        return edits
+
+
+@dataclass
+class FileDiff:
+    """
+    The diff of one file. `old_path` differs from `path` for renames; binary
+    files and files whose patch GitHub omits have no hunks.
+    """
+    path: str
+    old_path: str
+    status: str = "modified"
+    hunks: list[Hunk] = field(default_factory=list)
+    is_binary: bool = False
+    patch: str = ""
+
+    @property
+    def added_lines(self) -> set[int]:
+        """0-based line numbers of added lines in the patched file."""
+        added = set()
+        for hunk in self.hunks:
+            line = hunk.new_span.start
+            for op, _ in hunk.lines:
+                if op == '+':
+                    added.add(line)
+                if op != '-':
+                    line += 1
+        return added
+
+    @property
+    def deleted_lines(self) -> set[int]:
+        """0-based line numbers of deleted lines in the base file."""
+        deleted = set()
+        for hunk in self.hunks:
+            line = hunk.old_span.start
+            for op, _ in hunk.lines:
+                if op == '-':
+                    deleted.add(line)
+                if op != '+':
+                    line += 1
+        return deleted
+
+    def apply(self, source: str) -> PatchedFile:
+        """
+        Applies the hunks to `source` in a single pass. Context and deleted
+        lines are checked against the source; raises PatchError on mismatch.
+        """
+        source_lines = _split_lines(source)
+        out: list[str] = []
+        changes: list[tuple[int, str, str]] = []
+        src_idx = 0
+
+        for hunk in self.hunks:
+            hunk_start = hunk.old_span.start
+            if hunk_start < src_idx or hunk_start > len(source_lines):
+                raise PatchError(f"Hunk at line {hunk.old_start} is out of order or beyond end of source")
+            out.extend(source_lines[src_idx:hunk_start])
+            src_idx = hunk_start
+
+            last_new = _last_index(hunk.lines, '+ ')
+            run_start = None
+            old_run: list[str] = []
+            new_run: list[str] = []
+
+            for i, (op, text) in enumerate(hunk.lines):
+                if op == ' ':
+                    if run_start is not None:
+                        changes.append((run_start, "".join(old_run), "".join(new_run)))
+                        run_start, old_run, new_run = None, [], []
+                    out.append(self._consume(source_lines, src_idx, text))
+                    src_idx += 1
+                    continue
+
+                if run_start is None:
+                    run_start = len(out)
+                if op == '-':
+                    old_run.append(self._consume(source_lines, src_idx, text))
+                    src_idx += 1
+                else:
+                    ending = "" if i == last_new and hunk.new_missing_newline else "\n"
+                    out.append(text + ending)
+                    new_run.append(text + ending)
+
+            if run_start is not None:
+                changes.append((run_start, "".join(old_run), "".join(new_run)))
+
+        out.extend(source_lines[src_idx:])
+        return PatchedFile(text="".join(out), lines=out, changes=changes)
+
+    @staticmethod
+    def _consume(source_lines: list[str], index: int, expected: str) -> str:
+        if index >= len(source_lines):
+            raise PatchError(f"Patch extends beyond end of source at line {index + 1}")
+        line = source_lines[index]
+        if line.rstrip("\n") != expected:
+            raise PatchError(f"Patch context mismatch at source line {index + 1}: "
+                             f"expected {expected!r}, got {line.rstrip(chr(10))!r}")
+        return line
+
+
+def parse_patch(patch: Optional[str], path: str = "", old_path: Optional[str] = None,
+                status: str = "modified") -> FileDiff:
+    """
+    Parses the unified diff of a single file. Accepts both the bare hunks
+    GitHub returns in the `patch` field and full `git diff` output including
+    file headers; binary diffs produce a FileDiff without hunks.
+    """
+    diff = FileDiff(path=path, old_path=old_path or path, status=status, patch=patch or "")
+    if not patch:
+        return diff
+
+    lines = patch.split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.startswith("@@"):
+            if line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+                diff.is_binary = True
+            elif line.startswith("rename from "):
+                diff.old_path = line[len("rename from "):]
+                diff.status = "renamed"
+            elif line.startswith("rename to "):
+                diff.path = line[len("rename to "):]
+            i += 1
+            continue
+
+        m = HUNK_HEADER.match(line)
+        if not m:
+            raise PatchError(f"Malformed hunk header: {line}")
+        hunk = Hunk(
+            old_start=int(m.group(1)),
+            old_count=int(m.group(2)) if m.group(2) is not None else 1,
+            new_start=int(m.group(3)),
+            new_count=int(m.group(4)) if m.group(4) is not None else 1,
+        )
+        i += 1
+
+        old_seen = new_seen = 0
+        while i < len(lines) and (old_seen < hunk.old_count or new_seen < hunk.new_count):
+            body = lines[i]
+            op, text = (body[0], body[1:]) if body else (' ', '')
+            if op == ' ':
+                old_seen += 1
+                new_seen += 1
+            elif op == '-':
+                old_seen += 1
+            elif op == '+':
+                new_seen += 1
+            elif op == NO_NEWLINE_MARKER:
+                _mark_missing_newline(hunk)
+                i += 1
+                continue
+            else:
+                raise PatchError(f"Unexpected line in hunk: {body!r}")
+            hunk.lines.append((op, text))
+            i += 1
+
+        if old_seen != hunk.old_count or new_seen != hunk.new_count:
+            raise PatchError(f"Hunk body does not match header: {line}")
+
+        # "\ No newline at end of file" follows the last line it refers to.
+        while i < len(lines) and lines[i].startswith(NO_NEWLINE_MARKER):
+            _mark_missing_newline(hunk)
+            i += 1
+
+        diff.hunks.append(hunk)
+
+    return diff
+
+
+def from_pr_file(file: dict) -> FileDiff:
+    """Builds a FileDiff from an entry of GitHub's pull request files API."""
+    filename = file.get("filename", "")
+    diff = parse_patch(
+        file.get("patch"),
+        path=filename,
+        old_path=file.get("previous_filename") or filename,
+        status=file.get("status", "modified"),
+    )
+    # GitHub omits `patch` for binary files (and for very large diffs).
+    if not diff.hunks and not file.get("patch") and file.get("status") != "renamed":
+        diff.is_binary = True
+    return diff
+
+
+def _mark_missing_newline(hunk: Hunk) -> None:
+    if not hunk.lines:
+        return
+    op = hunk.lines[-1][0]
+    if op in (' ', '-'):
+        hunk.old_missing_newline = True
+    if op in (' ', '+'):
+        hunk.new_missing_newline = True
+
+
+def _split_lines(text: str) -> list[str]:
+    """Splits on '\\n' only, keeping line endings, like git does."""
+    parts = text.split("\n")
+    lines = [part + "\n" for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def _last_index(lines: list[tuple[str, str]], ops: str) -> int:
+    for i in range(len(lines) - 1, -1, -1):
+        if lines[i][0] in ops:
+            return i
+    return -1
+
+
+def _advance(point: tuple[int, int], text: bytes) -> tuple[int, int]:
+    newlines = text.count(b"\n")
+    if not newlines:
+        return point[0], point[1] + len(text)
+    return point[0] + newlines, len(text) - text.rfind(b"\n") - 1